@@ -0,0 +1,70 @@
+"""
+Measures the throughput of C-instruction encoding on a generated program. The
+field-by-field encoding (parser.dest/comp/jump followed by code.dest/comp/jump)
+is compared with a single lookup in the precomputed code.c_instruction_table.
+Usage: python benchmark.py [number of lines] (default is 1,000,000 lines).
+"""
+
+import hack_parser as parser, code
+import random 	# random.Random(seed) generates the same program every run
+import sys
+import time
+
+def generate(lines, seed=0):
+	"""
+	Returns a list of C-commands of the given length, drawn from every legal
+	combination of dest and comp mnemonics, and of comp and jump mnemonics.
+	"""
+	comps = list(code.comp_table)
+	comps += [c.replace('A', 'M') for c in comps if 'A' in c]
+	dests = [d for d in code.dest_table if d != 'null']
+	jumps = [j for j in code.jump_table if j != 'null']
+	rng = random.Random(seed)
+
+	commands = []
+	for i in range(lines):
+		if rng.random() < 0.8:
+			commands.append(rng.choice(dests) + '=' + rng.choice(comps))
+		else:
+			commands.append(rng.choice(comps) + ';' + rng.choice(jumps))
+
+	return commands
+
+def encode_fields(commands):
+	"""
+	Encodes commands by translating the dest, comp, and jump fields separately.
+	"""
+	return [
+		"111" +
+		code.comp(parser.comp(command)) +
+		code.dest(parser.dest(command)) +
+		code.jump(parser.jump(command))
+		for command in commands
+	]
+
+def encode_table(commands):
+	"""
+	Encodes commands with a single lookup of the whole C-command.
+	"""
+	return [code.c_instruction(command) for command in commands]
+
+def main(lines):
+	"""
+	Times both encoders on the same generated program and prints their
+	throughput in lines per second.
+	"""
+	commands = generate(lines)
+	results = {}
+	for name, encoder in [('fields', encode_fields), ('table', encode_table)]:
+		start = time.perf_counter()
+		results[name] = encoder(commands)
+		elapsed = time.perf_counter() - start
+		print(f'{name:>6}: {elapsed:.3f} s ({lines / elapsed:,.0f} lines/s)')
+		results[name + '_time'] = elapsed
+
+	# Both encoders must agree on every instruction
+	assert results['fields'] == results['table']
+	print(f'speedup: {results["fields_time"] / results["table_time"]:.1f}x')
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
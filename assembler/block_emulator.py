@@ -0,0 +1,250 @@
+"""
+Runs Hack machine code like emulator.py, but a block at a time rather than an
+instruction at a time. The first time the program counter reaches an address,
+the block of instructions that starts there (see block_source) is turned into
+the source code of a Python function that updates A, D, and RAM in
+straight-line code, where the values that A-instructions load are inlined as
+constants, and that returns the address of the next block. The function is
+compiled once, and kept in a jump table (a list indexed by ROM address) that is
+shared by every BlockEmulator running the same ROM. Usage:
+python block_emulator.py Prog.hack [--steps N] [--ram FIRST LAST]
+python block_emulator.py --benchmark [Prog.hack] [--steps N]
+"""
+
+import code, emulator, rom
+import hashlib
+import sys
+import time
+from array import array
+
+# Most instructions in a block, which bounds unrolled loops and compile time
+MAX_BLOCK = 128
+
+# Comp mnemonics, indexed by the a-bit and c-bits of a C-instruction (as in
+# emulator.comp_functions). C-bits without a mnemonic are computed by
+# emulator.alu().
+comp_mnemonics = {}
+for mnemonic, binary in code.comp_table.items():
+	comp_mnemonics[int(binary, 2)] = mnemonic
+	if 'A' in mnemonic:
+		comp_mnemonics[0x40 | int(binary, 2)] = mnemonic.replace('A', 'M')
+
+# Python conditions under which each conditional jump field (JGT to JLE)
+# jumps, given the result out
+conditions = [
+	None, '0 < out < 0x8000', 'out == 0', 'out < 0x8000', 'out >= 0x8000',
+	'out != 0', 'out == 0 or out >= 0x8000',
+]
+
+# The jump tables of every ROM loaded so far, by SHA-256 hash of the ROM
+jump_tables = {}
+
+def comp_expression(comp, a):
+	"""
+	Returns a Python expression for the 16-bit result of the comp field
+	(a-bit and c-bits) of a C-instruction, where a is the expression for the
+	value of the A register (a constant, if it is known, or 'a').
+	"""
+	m = f'ram[{a}]'
+	if comp not in comp_mnemonics:
+		return f'alu({comp & 0x3F}, d, {m if comp & 0x40 else a})'
+	mnemonic = comp_mnemonics[comp]
+	if mnemonic in ['0', '1', 'D', 'A', 'M']:
+		return {'0': '0', '1': '1', 'D': 'd', 'A': a, 'M': m}[mnemonic]
+	if mnemonic == '-1':
+		return '0xFFFF'
+	expression = mnemonic.replace('D', 'd').replace('M', m).replace('A', a)
+	return f'({expression.replace("!", "~")}) & 0xFFFF'
+
+def block_source(words, start, path=None):
+	"""
+	Returns the source code of a function that runs the block of a program
+	that starts at ROM address start. The function takes ram and the values
+	of A and D, and returns the values of A and D, the address of the next
+	block, and the number of instructions executed. If the block ends with
+	the program's final infinite loop, the address returned is ~address of
+	the loop's jump. If path is a list, the addresses of the instructions in
+	the block are appended to it.
+
+	A block runs on past conditional jumps (returning early if they are
+	taken) and follows unconditional jumps to constant addresses, so it is
+	really a trace through the program of up to MAX_BLOCK instructions: a
+	loop is unrolled into one block.
+	"""
+	lines = ['def block(ram, a, d):']
+	known = None 	# the value of A, if an A-instruction in the block set it
+	pc = start
+	count = 0
+	while pc < len(words) and count < MAX_BLOCK:
+		word = words[pc]
+		if path is not None:
+			path.append(pc)
+		pc += 1
+		count += 1
+		if word & 0x8000 == 0:
+			known = word
+			continue
+
+		a = 'a' if known is None else str(known)
+		comp, dest, jump = (word >> 6) & 0x7F, (word >> 3) & 0x7, word & 0x7
+		if jump:
+			if known is None and dest & 4:
+				lines.append('	target = a')
+				target = 'target'
+			else:
+				target = a
+		registers = [f'ram[{a}]'] * (dest & 1) + ['d'] * (dest >> 1 & 1) + ['a'] * (dest >> 2)
+		if len(registers) == 1 and jump in [0, 7]:
+			lines.append(f'	{registers[0]} = {comp_expression(comp, a)}')
+		elif dest or jump not in [0, 7]:
+			lines.append(f'	out = {comp_expression(comp, a)}')
+			lines += [f'	{register} = out' for register in registers]
+		if dest & 4:
+			known = None
+		if not jump:
+			continue
+
+		a = 'a' if known is None else str(known)
+		if jump != 7:
+			lines.append(f'	if {conditions[jump]}: return {a}, d, {target}, {count}')
+		elif pc > 1 and words[pc - 2] == pc - 2:
+			lines.append(f'	return {a}, d, {~(pc - 1)}, {count}')
+			break
+		elif target.isdigit():
+			pc = int(target)
+		else:
+			lines.append(f'	return {a}, d, {target}, {count}')
+			break
+	else:
+		a = 'a' if known is None else str(known)
+		lines.append(f'	return {a}, d, {pc}, {count}')
+
+	return '\n'.join(lines) + '\n'
+
+class BlockEmulator(emulator.Emulator):
+	"""
+	An emulated Hack computer that runs its program a block at a time (see
+	block_source). Has the same attributes and methods as Emulator, but run()
+	only stops between blocks, so it may run up to MAX_BLOCK instructions past
+	max_steps.
+	"""
+
+	def __init__(self, words):
+		"""
+		Loads a sequence of machine words (e.g., from rom.load_any) into the
+		ROM, then resets the computer. Blocks are compiled when first run.
+		"""
+		self.words = array('H', words)
+		key = hashlib.sha256(self.words.tobytes()).hexdigest()
+		self.blocks = jump_tables.setdefault(key, [None] * emulator.ROM_SIZE)
+		self.size = len(self.words)
+		self.ram = [0] * emulator.RAM_SIZE
+		self.reset()
+
+	def compile_block(self, start):
+		"""
+		Compiles the block that starts at ROM address start, adds it to the
+		jump table, and returns it. The addresses of its instructions are
+		kept in its .path attribute.
+		"""
+		namespace = {'alu': emulator.alu}
+		path = []
+		source = block_source(self.words, start, path)
+		exec(compile(source, f'<block {start}>', 'exec'), namespace)
+		self.blocks[start] = namespace['block']
+		self.blocks[start].path = path
+		return self.blocks[start]
+
+	def run(self, max_steps=10 ** 9):
+		"""
+		Runs the program from the current state until it halts (see
+		Emulator.run) or at least max_steps instructions have been executed.
+		Returns the number of instructions executed. Raises EmulatorError if
+		the program addresses RAM out of range.
+		"""
+		blocks, ram, size = self.blocks, self.ram, self.size
+		a, d, pc = self.a, self.d, self.pc
+
+		steps = 0
+		try:
+			while steps < max_steps:
+				if pc >= size:
+					# Running off the end of the ROM takes one instruction
+					steps += 1
+					self.halted = True
+					break
+				block = blocks[pc] or self.compile_block(pc)
+				a, d, pc, count = block(ram, a, d)
+				steps += count
+				if pc < 0:
+					pc = ~pc
+					self.halted = True
+					break
+		except IndexError:
+			# pc is still the start of the block that failed
+			raise emulator.EmulatorError(
+				f"a RAM address is out of range in the block that starts at {pc}."
+			)
+
+		self.a, self.d, self.pc = a, d, pc
+		return steps
+
+def load(input_file):
+	"""
+	Returns a BlockEmulator with a .hack file or packed ROM image loaded.
+	"""
+	return BlockEmulator(rom.load_any(input_file))
+
+def benchmark(words, steps=10 ** 7, ram=()):
+	"""
+	Runs a program for the given number of instructions on an Emulator, then
+	twice on a BlockEmulator, after setting RAM[0], RAM[1], ... to the values
+	in ram. Returns the number of instructions executed per second by each of
+	the three runs. Blocks are compiled during the first BlockEmulator run,
+	and the second reuses them from the jump table of the ROM.
+	"""
+	jump_tables.clear()
+	rates = []
+	for engine in [emulator.Emulator, BlockEmulator, BlockEmulator]:
+		computer = engine(words)
+		computer.ram[:len(ram)] = ram
+		start = time.perf_counter()
+		executed = computer.run(steps)
+		rates.append(executed / (time.perf_counter() - start))
+
+	return rates
+
+if __name__ == '__main__':
+	options = sys.argv[1:]
+	steps = int(options[options.index('--steps') + 1]) if '--steps' in options else None
+	files = [option for option in options if option.endswith(('.hack', '.rom'))]
+	if '--benchmark' in options:
+		if files:
+			rates = benchmark(rom.load_any(files[0]), steps or 10 ** 9)
+		else:
+			import hack_assembler
+			words = hack_assembler.assemble(emulator.benchmark_program)
+			rates = benchmark(words, steps or 10 ** 7, [3, 1000])
+		print(f'emulator:       {rates[0] / 1e6:.2f} million instructions per second')
+		for run, rate in [('compiling', rates[1]), ('compiled', rates[2])]:
+			print(f'block emulator: {rate / 1e6:.2f} million instructions per second '
+				f'({rate / rates[0]:.1f}x, {run})')
+	else:
+		try:
+			computer = load(files[0])
+		except rom.FormatError as error:
+			sys.exit(f"FormatError: {error}")
+		start = time.perf_counter()
+		try:
+			executed = computer.run(steps or 10 ** 9)
+		except emulator.EmulatorError as error:
+			sys.exit(f"EmulatorError: {error}")
+		elapsed = time.perf_counter() - start
+		print(f'{executed} instructions in {elapsed:.3f}s '
+			f'({executed / elapsed / 1e6:.2f} million per second)'
+			+ (', halted' if computer.halted else ''))
+		if '--ram' in options:
+			first = int(options[options.index('--ram') + 1])
+			last = int(options[options.index('--ram') + 2])
+			for address in range(first, last + 1):
+				print(f'RAM[{address}] = {computer.signed(address)}')
@@ -68,6 +68,77 @@ def jump(mnemonic):
 	"""
 	return jump_table[mnemonic]
 
+def build_c_instruction_table():
+	"""
+	Precomputes the full 16-bit binary code (str) of every legal C-instruction,
+	keyed by its canonical mnemonic (e.g., 'D=M', '0;JMP', 'AM=M-1;JNE'), so
+	that translating a C-command is a single dictionary lookup.
+	"""
+	table = {}
+	for comp_mnemonic, c_bits in comp_table.items():
+		# A-bit 0 computes with A, and a-bit 1 computes with M
+		variants = {comp_mnemonic: '0'}
+		if 'A' in comp_mnemonic:
+			variants[comp_mnemonic.replace('A', 'M')] = '1'
+		for mnemonic, a_bit in variants.items():
+			for dest_mnemonic, d_bits in dest_table.items():
+				for jump_mnemonic, j_bits in jump_table.items():
+					command = mnemonic
+					if dest_mnemonic != 'null':
+						command = dest_mnemonic + '=' + command
+					if jump_mnemonic != 'null':
+						command = command + ';' + jump_mnemonic
+					table[command] = '111' + a_bit + c_bits + d_bits + j_bits
+
+	return table
+
+c_instruction_table = build_c_instruction_table()
+
+def c_instruction(command):
+	"""
+	Translates a whole C-command into 16-bit binary (str). Commands written in
+	canonical form are found directly in c_instruction_table. Otherwise, the
+	command is normalised (whitespace removed, dest registers put in AMD order,
+	operands of commutative operators swapped) before being looked up again.
+	"""
+	try:
+		return c_instruction_table[command]
+	except KeyError:
+		pass
+
+	command = ''.join(command.split())
+	if command in c_instruction_table:
+		return c_instruction_table[command]
+
+	dest_mnemonic, jump_mnemonic = '', ''
+	if ';' in command:
+		command, jump_mnemonic = command.split(';')
+		jump_mnemonic = ';' + jump_mnemonic
+	if '=' in command:
+		dest_mnemonic, command = command.split('=')
+		dest_mnemonic = ''.join(r for r in 'AMD' if r in dest_mnemonic) + '='
+	if (dest_mnemonic + command + jump_mnemonic) not in c_instruction_table:
+		for operator in '+&|':
+			if operator in command:
+				x, y = command.split(operator)
+				command = y + operator + x
+
+	return c_instruction_table[dest_mnemonic + command + jump_mnemonic]
+
+c_word_table = {
+	command: int(binary, 2) for command, binary in c_instruction_table.items()
+}
+
+def c_word(command):
+	"""
+	Translates a whole C-command into a 16-bit machine word (int). Like
+	c_instruction, but for callers that work with words rather than text.
+	"""
+	try:
+		return c_word_table[command]
+	except KeyError:
+		return int(c_instruction(command), 2)
+
 def get_a_instruction(decimal):
 	"""
 	Convert decimal value (str) into 16-bit binary (str). Ensure that MSB
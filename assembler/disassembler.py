@@ -0,0 +1,91 @@
+"""
+Translates Hack machine code (a .hack file or a packed .rom image) back into
+Hack assembly language. The whole ROM is decoded at once with NumPy: the fields
+of every instruction are split with vectorised bit operations and mapped back
+to mnemonics through inverted versions of the tables in code.py. Reassembling
+the output gives the same machine code. Usage:
+python disassembler.py Prog.hack [Prog.dis.asm] (prints to stdout by default)
+"""
+
+import code, rom
+import sys
+import numpy as np
+
+def invert(table):
+	"""
+	Returns an array that maps the binary code (as an int) of each mnemonic in
+	one of the tables in code.py back to the mnemonic. 'null' is mapped to ''.
+	"""
+	mnemonics = np.full(2 ** len(next(iter(table.values()))), '', dtype=object)
+	for mnemonic, binary in table.items():
+		mnemonics[int(binary, 2)] = '' if mnemonic == 'null' else mnemonic
+
+	return mnemonics
+
+# dest and jump mnemonics with the '=' and ';' that separate them from comp
+dest_mnemonics = invert(code.dest_table) + '='
+dest_mnemonics[0] = ''
+jump_mnemonics = ';' + invert(code.jump_table)
+jump_mnemonics[0] = ''
+
+# comp mnemonics indexed by [a-bit, c-bits], where a-bit 1 uses M instead of A.
+# Combinations of c-bits without a mnemonic are None.
+comp_mnemonics = np.full((2, 64), None, dtype=object)
+for mnemonic, binary in code.comp_table.items():
+	comp_mnemonics[0, int(binary, 2)] = mnemonic
+	if 'A' in mnemonic:
+		comp_mnemonics[1, int(binary, 2)] = mnemonic.replace('A', 'M')
+
+# Every A-instruction, indexed by its 15-bit value
+a_mnemonics = np.array(['@' + str(value) for value in range(2 ** 15)], dtype=object)
+
+def decode(words):
+	"""
+	Decodes a sequence of machine words (e.g., from rom.load_any) and returns
+	an array of assembly language commands (str), one per word.
+	"""
+	words = np.asarray(words, dtype=np.uint16)
+
+	# Split the fields of every word at once
+	is_a = (words & 0x8000) == 0
+	value = words & 0x7FFF
+	a_bit = (words >> 12) & 1
+	comp = (words >> 6) & 0x3F
+	dest = (words >> 3) & 0x7
+	jump = words & 0x7
+
+	comps = comp_mnemonics[a_bit, comp]
+	unknown = np.equal(comps, None)
+	comps[unknown] = ''
+	invalid = ~is_a & unknown
+	commands = np.where(
+		is_a,
+		a_mnemonics[value],
+		dest_mnemonics[dest] + comps + jump_mnemonics[jump]
+	)
+
+	# C-instructions without a comp mnemonic can't be assembled, so keep
+	# their binary code in a comment
+	for i in np.flatnonzero(invalid):
+		commands[i] = f'// invalid instruction {int(words[i]):016b}'
+
+	return commands
+
+def disassemble_file(input_file):
+	"""
+	Disassembles a .hack file or packed ROM image, and returns the assembly
+	language program as a str.
+	"""
+	commands = decode(rom.load_any(input_file))
+	return '\n'.join(commands) + '\n' if len(commands) else ''
+
+if __name__ == '__main__':
+	try:
+		program = disassemble_file(sys.argv[1])
+	except rom.FormatError as error:
+		sys.exit(f"FormatError: {error}")
+	if len(sys.argv) > 2:
+		with open(sys.argv[2], 'w') as f:
+			f.write(program)
+	else:
+		sys.stdout.write(program)
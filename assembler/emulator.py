@@ -0,0 +1,242 @@
+"""
+Runs Hack machine code (a .hack file or a packed .rom image) on an emulated
+Hack computer, as specified by cpu/CPU.hdl and cpu/Computer.hdl. Every word of
+the ROM is decoded once, into parallel lists that the dispatch loop indexes by
+the program counter: whether the word is an A-instruction, its value, a
+function that computes its comp field, and its dest and jump fields. The loop
+then only does a few list lookups per instruction. Usage:
+python emulator.py Prog.hack [--steps N] [--ram FIRST LAST]
+python emulator.py --benchmark [--steps N]
+"""
+
+import code, rom
+import sys
+import time
+
+RAM_SIZE = 32768 	# words of RAM, including the screen and keyboard maps
+ROM_SIZE = 65536 	# every value of A, so that any jump target can be decoded
+
+# Whether a jump is taken, indexed by the jump field and then by the 16-bit
+# result of the comp field: JGT is 1, JEQ is 2, and JLT is 4.
+jump_tables = [
+	bytes(
+		bool(jump & 4 and value & 0x8000 or jump & 2 and value == 0
+		or jump & 1 and 0 < value < 0x8000)
+		for value in range(65536)
+	)
+	for jump in range(8)
+]
+
+# The jump table of instructions that stop the emulator when they jump: the
+# end of the program, and the infinite loop (@LOOP, 0;JMP at LOOP) that Hack
+# programs end with.
+halt = bytes([1]) * 65536
+
+class EmulatorError(Exception):
+	"""
+	Raised when a program addresses RAM outside of the emulated computer.
+	"""
+
+def comp_source(mnemonic):
+	"""
+	Returns a Python expression over d, a, and ram that computes the comp
+	mnemonic as a 16-bit value.
+	"""
+	expression = mnemonic.replace('D', 'd').replace('A', 'a').replace('M', 'ram[a]')
+	return f'({expression.replace("!", "~")}) & 0xFFFF'
+
+def alu(c, x, y):
+	"""
+	Computes the output of the ALU for the c-bits of an instruction (zx, nx,
+	zy, ny, f, no) that have no mnemonic.
+	"""
+	if c & 0x20: x = 0
+	if c & 0x10: x = ~x & 0xFFFF
+	if c & 0x08: y = 0
+	if c & 0x04: y = ~y & 0xFFFF
+	out = (x + y) & 0xFFFF if c & 0x02 else x & y
+	return ~out & 0xFFFF if c & 0x01 else out
+
+def comp_functions(ram):
+	"""
+	Returns a list of 128 functions of d and a, indexed by the a-bit and
+	c-bits of a C-instruction (i.e., bits 6-12), that compute its comp field.
+	Functions with the a-bit set read ram[a].
+	"""
+	functions = [None] * 128
+	for mnemonic, binary in code.comp_table.items():
+		for a_bit, operand in [(0, 'A'), (1, 'M')]:
+			if a_bit and 'A' not in mnemonic:
+				continue
+			source = comp_source(mnemonic.replace('A', operand))
+			functions[a_bit << 6 | int(binary, 2)] = eval(f'lambda d, a: {source}', {'ram': ram})
+
+	for i in range(128):
+		if functions[i] is None:
+			c = i & 0x3F
+			if i & 0x40:
+				functions[i] = lambda d, a, c=c: alu(c, d, ram[a])
+			else:
+				functions[i] = lambda d, a, c=c: alu(c, d, a)
+
+	return functions
+
+class Emulator():
+	"""
+	An emulated Hack computer, with a program loaded in its ROM. The state of
+	the computer is available as attributes: the registers (.a, .d, .pc), the
+	RAM (.ram, a list of ints from 0 to 65535), and whether it has halted.
+	"""
+
+	def __init__(self, words):
+		"""
+		Loads a sequence of machine words (e.g., from rom.load_any) into the
+		ROM and decodes every one of them, then resets the computer.
+		"""
+		self.ram = [0] * RAM_SIZE
+		comps = comp_functions(self.ram)
+		words = list(words)
+
+		self.is_a = [False] * ROM_SIZE
+		self.value = [0] * ROM_SIZE
+		self.comp = [comps[0b0101010]] * ROM_SIZE 		# 0
+		self.dest = [0] * ROM_SIZE
+		self.jump = [halt] * ROM_SIZE
+		for pc, word in enumerate(words):
+			if word & 0x8000 == 0:
+				self.is_a[pc] = True
+				self.value[pc] = word
+				continue
+			self.comp[pc] = comps[(word >> 6) & 0x7F]
+			self.dest[pc] = (word >> 3) & 0x7
+			self.jump[pc] = jump_tables[word & 0x7]
+			if word & 0x7 == 0x7 and pc and words[pc - 1] == pc - 1:
+				self.jump[pc] = halt
+
+		self.size = len(words)
+		self.reset()
+
+	def reset(self):
+		"""
+		Resets the registers and clears the RAM, as the reset input does.
+		"""
+		self.ram[:] = [0] * RAM_SIZE
+		self.a = self.d = self.pc = 0
+		self.halted = False
+
+	def run(self, max_steps=10 ** 9):
+		"""
+		Runs the program from the current state until it halts (i.e., runs
+		off the end of the ROM, or jumps to itself in the final @LOOP, 0;JMP
+		loop) or max_steps instructions have been executed. Returns the number
+		of instructions executed. Raises EmulatorError if the program
+		addresses RAM out of range.
+		"""
+		is_a, value, comp, dest, jump = self.is_a, self.value, self.comp, self.dest, self.jump
+		ram = self.ram
+		a, d, pc = self.a, self.d, self.pc
+
+		steps = 0
+		try:
+			while steps < max_steps:
+				steps += 1
+				if is_a[pc]:
+					a = value[pc]
+					pc += 1
+					continue
+				out = comp[pc](d, a)
+				target = a
+				k = dest[pc]
+				if k:
+					if k & 1: ram[a] = out
+					if k & 2: d = out
+					if k & 4: a = out
+				table = jump[pc]
+				if table[out]:
+					if table is halt:
+						self.halted = True
+						break
+					pc = target
+				else:
+					pc += 1
+		except IndexError:
+			raise EmulatorError(f"address {a} is out of range at ROM address {pc}.")
+
+		self.a, self.d, self.pc = a, d, pc
+		return steps
+
+	def signed(self, address):
+		"""
+		Returns the word at a RAM address as a signed int.
+		"""
+		value = self.ram[address]
+		return value - 0x10000 if value & 0x8000 else value
+
+def load(input_file):
+	"""
+	Returns an Emulator with a .hack file or packed ROM image loaded.
+	"""
+	return Emulator(rom.load_any(input_file))
+
+# Multiplies R0 by R1 into R2 by repeated addition, forever, for benchmark()
+benchmark_program = """
+	@R2
+	M=0
+(LOOP)
+	@R1
+	D=M
+	@R3
+	M=D
+(MULTIPLY)
+	@R3
+	D=M
+	@LOOP
+	D;JEQ
+	@R0
+	D=M
+	@R2
+	M=D+M
+	@R3
+	M=M-1
+	@MULTIPLY
+	0;JMP
+"""
+
+def benchmark(steps=10 ** 7):
+	"""
+	Runs a loop of memory reads and writes, arithmetic, and jumps for the
+	given number of instructions, and returns the number of instructions
+	executed per second.
+	"""
+	import hack_assembler
+	emulator = Emulator(hack_assembler.assemble(benchmark_program))
+	emulator.ram[0], emulator.ram[1] = 3, 1000
+	start = time.perf_counter()
+	executed = emulator.run(steps)
+	return executed / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+	options = sys.argv[1:]
+	steps = int(options[options.index('--steps') + 1]) if '--steps' in options else None
+	if '--benchmark' in options:
+		rate = benchmark(steps or 10 ** 7)
+		print(f'{rate / 1e6:.2f} million Hack instructions per second')
+	else:
+		try:
+			emulator = load(options[0])
+		except rom.FormatError as error:
+			sys.exit(f"FormatError: {error}")
+		start = time.perf_counter()
+		try:
+			executed = emulator.run(steps or 10 ** 9)
+		except EmulatorError as error:
+			sys.exit(f"EmulatorError: {error}")
+		elapsed = time.perf_counter() - start
+		print(f'{executed} instructions in {elapsed:.3f}s '
+			f'({executed / elapsed / 1e6:.2f} million per second)'
+			+ (', halted' if emulator.halted else ''))
+		if '--ram' in options:
+			first = int(options[options.index('--ram') + 1])
+			last = int(options[options.index('--ram') + 2])
+			for address in range(first, last + 1):
+				print(f'RAM[{address}] = {emulator.signed(address)}')
@@ -1,5 +1,8 @@
 import hack_parser as parser, code, symbol_table as st
+import peephole, relocatable, rom, source_map
 import sys 		# sys.argv returns a list of command line arguments
+from concurrent.futures import ProcessPoolExecutor 	# pool for --jobs
+from array import array 	# array('H') stores 16-bit machine words compactly
 
 def char_test(chars, symbol_table, RAM_counter):
 	"""
@@ -40,51 +43,274 @@ def first_pass(commands, symbol_table):
 
 	return symbol_table
 
+def translate(
+		commands, symbol_table,
+		a_instruction=code.get_a_instruction, c_instruction=code.c_instruction
+	):
+	"""
+	Pass through the assembly program's commands, parse each line, and yield
+	the binary form of each A/C command, in the order of the ROM. By default,
+	instructions are 16-bit binary strings; pass a_instruction=int and
+	c_instruction=code.c_word to get machine words (ints) instead.
+	"""
+	RAM_counter = 16 	# 16 is next free RAM address after predefined symbols
+	for command in commands:
+		c_type = parser.command_type(command)
+		if c_type == "A_COMMAND":
+			chars = parser.symbol(command)
+			# Test whether chars in the A-instruction are symbol or number
+			results = char_test(chars, symbol_table, RAM_counter)
+			chars = results['c']
+			symbol_table = results['st']
+			RAM_counter = results['ram']
+			# Translate chars into a instruction
+			yield a_instruction(chars)
+		elif c_type == "C_COMMAND":
+			# Look up the precomputed binary code of the whole C-command
+			yield c_instruction(command)
+
 def second_pass(commands, symbol_table, output_file):
 	"""
-	Pass through the assembly program's commands, parse each line, and translate
-	commands into binary form, and write to .hack file that CPU can load in ROM.
+	Pass through the assembly program's commands, translate commands into
+	binary form, and write to .hack file that CPU can load in ROM. Any existing
+	output_file is overwritten.
+	"""
+	with open(output_file, 'w') as f:
+		for instruction in translate(commands, symbol_table):
+			f.write(instruction + '\n')
+
+def packed_pass(commands, symbol_table, output_file):
+	"""
+	Pass through the assembly program's commands, translate commands into
+	machine words, and write them to a packed ROM image (see rom.py) in one go.
+	"""
+	rom.write(
+		array('H', translate(commands, symbol_table, int, code.c_word)),
+		output_file
+	)
+
+def allocate_variables(commands, symbol_table):
+	"""
+	Scan the A-commands of the assembly program and add every variable to the
+	symbol table (built by first_pass), allocating RAM addresses in order of
+	first appearance, so that the symbol table resolves every symbol. Return
+	the symbol table.
 	"""
 	RAM_counter = 16 	# 16 is next free RAM address after predefined symbols
-	with open(output_file, 'a') as f:
+	for command in commands:
+		if command[0] == "@":
+			results = char_test(command[1:], symbol_table, RAM_counter)
+			RAM_counter = results['ram']
+
+	return symbol_table
+
+# Complete symbol table used by the worker processes of parallel_pass
+worker_symbol_table = None
+
+def initialise_worker(symbol_table):
+	"""
+	Runs once in every worker process of parallel_pass to receive the symbol
+	table, rather than sending it along with every chunk.
+	"""
+	global worker_symbol_table
+	worker_symbol_table = symbol_table
+
+def translate_chunk(commands):
+	"""
+	Translates a chunk of commands in a worker process and returns the text
+	of the chunk in the .hack file.
+	"""
+	return ''.join(
+		instruction + '\n'
+		for instruction in translate(commands, worker_symbol_table)
+	)
+
+def parallel_pass(commands, symbol_table, output_file, jobs):
+	"""
+	Translate commands into binary form using a pool of jobs processes, and
+	write to .hack file. Once the symbol table is complete (i.e., variables
+	have been allocated as well as labels), every command can be translated
+	independently, so commands are split into chunks that are translated in
+	parallel and written in order. Output is identical to second_pass.
+	"""
+	symbol_table = allocate_variables(commands, symbol_table)
+	size = max(1, -(-len(commands) // (4 * jobs))) 	# 4 chunks per process
+	chunks = [commands[i:i + size] for i in range(0, len(commands), size)]
+
+	with ProcessPoolExecutor(
+		jobs, initializer=initialise_worker, initargs=(symbol_table,)
+	) as pool:
+		with open(output_file, 'w') as f:
+			for text in pool.map(translate_chunk, chunks):
+				f.write(text)
+
+def single_pass(commands, symbol_table, output_file):
+	"""
+	Translate commands into binary form in a single pass, writing each
+	instruction to output_file as soon as it has been parsed. Commands can be
+	any iterable (e.g., a lazy parser.stream), so the whole program is never
+	held in memory. A-instructions that refer to a symbol that has not been
+	declared yet are written as placeholders and backpatched once every label
+	is known. Symbols that never turn out to be labels are variables, which are
+	allocated RAM addresses in order of first appearance (as in second_pass).
+	"""
+	ROM_counter = 0 	# ROM address of the next A/C instruction
+	# Unresolved symbol -> ROM address of its most recent reference. Each
+	# placeholder holds the ROM address (+1) of the previous reference to the
+	# same symbol, so the references form a chain through output_file itself
+	# and only one address per unresolved symbol is kept in memory.
+	forward_refs = {}
+
+	with open(output_file, 'w', newline='\n') as f:
 		for command in commands:
 			c_type = parser.command_type(command)
 			if c_type == "A_COMMAND":
 				chars = parser.symbol(command)
-				# Test whether chars in the A-instruction are symbol or number
-				results = char_test(chars, symbol_table, RAM_counter)
-				chars = results['c']
-				symbol_table = results['st']
-				RAM_counter = results['ram']
-				# Translate chars into a instruction and write to f
+				try:
+					int(chars)
+				except ValueError:
+					if st.contains(chars, symbol_table):
+						chars = st.get_address(chars, symbol_table)
+					else:
+						# Label declared later on, or a variable: patch at end
+						link = forward_refs.get(chars, -1) + 1
+						forward_refs[chars] = ROM_counter
+						f.write(f'{link:016d}\n')
+						ROM_counter += 1
+						continue
 				f.write(
 					code.get_a_instruction(chars) + '\n'
 				)
+				ROM_counter += 1
 			elif c_type == "C_COMMAND":
-				jump_mnemonic = parser.jump(command)
-				dest_mnemonic = parser.dest(command)
-				comp_mnemonic = parser.comp(command)
-				f.write(
-					"111" + 
-					code.comp(comp_mnemonic) +
-					code.dest(dest_mnemonic) +
-					code.jump(jump_mnemonic) + '\n'
-				)
+				# Look up the precomputed binary code of the whole C-command
+				f.write(code.c_instruction(command) + '\n')
+				ROM_counter += 1
+			else:
+				# Labels refer to the ROM address of the next instruction
+				st.add_entry(parser.symbol(command), ROM_counter, symbol_table)
+
+	# Every line in output_file is 17 bytes long, so the placeholder for the
+	# instruction at ROM address n starts at byte 17 * n.
+	RAM_counter = 16 	# 16 is next free RAM address after predefined symbols
+	with open(output_file, 'r+b') as f:
+		for symbol, ROM_address in forward_refs.items():
+			if st.contains(symbol, symbol_table):
+				address = st.get_address(symbol, symbol_table)
+			else:
+				address = RAM_counter
+				RAM_counter += 1
+			binary = code.get_a_instruction(address).encode()
+			# Walk the chain of references, replacing each placeholder
+			while ROM_address >= 0:
+				f.seek(17 * ROM_address)
+				link = int(f.read(16))
+				f.seek(17 * ROM_address)
+				f.write(binary)
+				ROM_address = link - 1
+
+def assemble(source):
+	"""
+	Assembles a Hack assembly program held in memory and returns its machine
+	code as an array('H'). The source is either a string or an iterable of
+	lines (e.g., a list of strings or an open file). Nothing is written to disk,
+	so one process can assemble any number of programs.
+	"""
+	if isinstance(source, str):
+		source = source.splitlines()
+	commands = list(parser.clean(source))
+	# Each program gets a fresh symbol table with predefined labels
+	symbol_table = first_pass(commands, st.initialise(st.constructor()))
+
+	return array('H', translate(commands, symbol_table, int, code.c_word))
+
+def assemble_file(path, out=None):
+	"""
+	Assembles the .asm file at path and returns its machine code as an
+	array('H'). If out is given, the machine code is also written to it: as a
+	packed ROM image (see rom.py) if out ends with .rom, else as a .hack file.
+	"""
+	with open(path) as f:
+		words = assemble(f)
+
+	if out is not None:
+		if out.endswith('.rom'):
+			rom.write(words, out)
+		else:
+			rom.write_hack(words, out)
+
+	return words
 
-def main(input_file, output_file):
+def main(
+		input_file, output_file, stream=False, packed=False, jobs=1,
+		optimise=False
+	):
 	"""
 	Runs assembler. Input should be an .asm file written in Hack assembly
 	language, and output is a .hack file written in Hack machine code.
-	Note that this assembler assumes that the .asm file is error-free. 
+	Note that this assembler assumes that the .asm file is error-free. If
+	stream is true, the .asm file is read lazily and assembled in a single
+	pass with backpatching, which keeps memory use flat for large programs.
+	If packed is true, output is a packed binary ROM image instead. If jobs
+	is greater than 1, the second pass is run by that many processes. If
+	optimise is true, the commands are first optimised by peephole.py. The
+	streaming pass can't be combined with packed, jobs, or optimise, since it
+	never holds the whole program; doing so raises ValueError.
 	"""
+	if stream and (packed or jobs > 1 or optimise):
+		raise ValueError("stream can't be combined with packed, jobs, or optimise")
 	# Construct and initialise symbol table with predefined labels
 	symbol_table = st.initialise(st.constructor())
+	if stream:
+		# Read commands lazily and translate each of them exactly once
+		single_pass(parser.stream(input_file), symbol_table, output_file)
+		return
 	# Generate list of assembly language commands based on input_file
 	commands = parser.initialise(input_file)
+	if optimise:
+		before = peephole.count_words(commands)
+		commands, _ = peephole.optimise(commands)
+		print(f'peephole: {before - peephole.count_words(commands)} ROM words saved')
 	# Run first pass through commands to build symbol table
 	symbol_table = first_pass(commands, symbol_table)
 	# Run second pass through commands and write to output_file
-	second_pass(commands, symbol_table, output_file)
+	if packed:
+		packed_pass(commands, symbol_table, output_file)
+	elif jobs > 1:
+		parallel_pass(commands, symbol_table, output_file, jobs)
+	else:
+		second_pass(commands, symbol_table, output_file)
 
-# Execute main() with command line argument as input_file
-main(sys.argv[1], (sys.argv[1]).split('.')[0] + '.hack')
\ No newline at end of file
+if __name__ == '__main__':
+	# Execute main() with command line argument as input_file. Pass --stream to
+	# assemble large files in a single streaming pass, or --packed to write a
+	# packed binary ROM image (.rom) instead of a .hack file. Pass --object to
+	# write a relocatable object (.hobj) for linker.py instead. Pass --jobs N
+	# to run the second pass in N processes. Pass --map to also write a source
+	# map (.hackmap) that ties ROM addresses back to the .asm file. Pass
+	# --optimise to run the peephole optimiser before assembling. --stream
+	# can't be combined with --packed, --object, --jobs, or --optimise.
+	options = sys.argv[2:]
+	stem = (sys.argv[1]).split('.')[0]
+	if '--stream' in options:
+		for option in ['--packed', '--object', '--jobs', '--optimise']:
+			if option in options:
+				sys.exit(f"UsageError: --stream can't be combined with {option}.")
+	if '--map' in options and '--optimise' in options:
+		# Optimised code no longer matches the lines of the .asm file
+		print('--map is ignored with --optimise')
+	elif '--map' in options:
+		source_map.write(
+			source_map.build_file(sys.argv[1]), stem + '.hackmap', sys.argv[1]
+		)
+	if '--object' in options:
+		relocatable.write(relocatable.assemble_file(sys.argv[1]), stem + '.hobj')
+	else:
+		main(
+			sys.argv[1],
+			stem + ('.rom' if '--packed' in options else '.hack'),
+			'--stream' in options,
+			'--packed' in options,
+			int(options[options.index('--jobs') + 1]) if '--jobs' in options else 1,
+			'--optimise' in options
+		)
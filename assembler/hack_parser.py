@@ -9,23 +9,40 @@ def initialise(input_file):
 	Opens the input file (.asm) and appends all lines containing commands to a
 	list, which is returned. Newline characters and whitespace are removed. 
 	"""
-	lines = [] 			# stores lines from input_file 
-	commands = []		# stores commands from "cleaned" lines
+	with open(input_file) as f:
+		commands = list(clean(f))
+
+	return commands
 
+def stream(input_file):
+	"""
+	Lazily yields the commands in the input file (.asm), one at a time, so that
+	arbitrarily large files can be assembled without holding them in memory.
+	"""
 	with open(input_file) as f:
-		for line in f:
-			lines.append(line)
+		yield from clean(f)
 
+def clean(lines):
+	"""
+	Yields the command on each line of an iterable of lines, skipping lines
+	that are blank or only contain a comment. Comments on the same line as a
+	command, and whitespace surrounding the command, are removed.
+	"""
 	for line in lines:
-		if line[0] != "/" and line != "\n":
-			# ignore whitespace on LHS (necessary for files with tabbing)
-			line = line.lstrip()
-			# ignore comments on same line in .asm file
-			line = line.split()[0]
-			# ignore newline chars on RHS of every line
-			commands.append(line.rstrip("\n"))
+		# ignore comments, whitespace on LHS (tabbing), and newline chars on RHS
+		line = line.split("//")[0].strip()
+		if line:
+			yield line
 
-	return commands
+def numbered(lines):
+	"""
+	Like clean(), but yields (line number, command) pairs, where line numbers
+	start at 1, so that commands can be traced back to the .asm file.
+	"""
+	for line_number, line in enumerate(lines, 1):
+		line = line.split("//")[0].strip()
+		if line:
+			yield line_number, line
 
 def command_type(command):
 	"""
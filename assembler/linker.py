@@ -0,0 +1,107 @@
+"""
+Links relocatable objects (see relocatable.py) into a complete Hack program.
+Objects are placed in ROM one after the other, labels are resolved across
+objects, and variables are allocated RAM addresses from 16 upward, in order of
+first appearance. The result is identical to assembling the concatenation of
+the .asm files in one go. Only .asm files that changed since their .hobj file
+was written need to be reassembled. Usage:
+python linker.py Prog.hack A.asm B.asm ... (or Prog.rom for a packed image)
+"""
+
+import relocatable, rom
+import os 		# os.path.getmtime() tells whether an object is out of date
+import sys
+from array import array
+
+class LinkError(Exception):
+	"""
+	Raised when objects can't be linked, e.g., because two of them declare
+	the same label.
+	"""
+
+def link(objects):
+	"""
+	Links a list of objects, in order, and returns the machine code of the
+	program as an array('H'). Takes time linear in the size of the code plus
+	the number of symbols. Raises LinkError if a label is declared twice.
+	"""
+	# Assign ROM offsets and build the table of labels in all objects
+	labels = {}
+	bases = []
+	ROM_counter = 0
+	for obj in objects:
+		for label, offset in obj['labels'].items():
+			if label in labels:
+				raise LinkError(
+					f"label {label} in {obj['name']} is already declared in "
+					f"another object."
+				)
+			labels[label] = ROM_counter + offset
+		bases.append(ROM_counter)
+		ROM_counter += len(obj['words'])
+
+	words = array('H')
+	variables = {}
+	RAM_counter = 16 	# 16 is next free RAM address after predefined symbols
+	for obj, base in zip(objects, bases):
+		words.extend(obj['words'])
+		# Move local label addresses by the ROM address of the object
+		for offset in obj['relocations']:
+			words[base + offset] += base
+		# Patch references to labels in other objects and to variables
+		for symbol, offsets in obj['references'].items():
+			if symbol in labels:
+				address = labels[symbol]
+			elif symbol in variables:
+				address = variables[symbol]
+			else:
+				address = variables[symbol] = RAM_counter
+				RAM_counter += 1
+			for offset in offsets:
+				words[base + offset] = address
+
+	return words
+
+def object_file(input_file):
+	"""
+	Returns the name of the object file (.hobj) of an .asm file.
+	"""
+	return input_file.rsplit('.', 1)[0] + '.hobj'
+
+def load_objects(input_files):
+	"""
+	Returns the objects of a list of .asm files. An .asm file is only
+	assembled if its object file is missing or older than the .asm file;
+	otherwise, the object file is loaded.
+	"""
+	objects = []
+	for input_file in input_files:
+		obj_file = object_file(input_file)
+		if (
+			os.path.exists(obj_file)
+			and os.path.getmtime(obj_file) >= os.path.getmtime(input_file)
+		):
+			objects.append(relocatable.load(obj_file))
+		else:
+			obj = relocatable.assemble_file(input_file)
+			relocatable.write(obj, obj_file)
+			objects.append(obj)
+
+	return objects
+
+def main(output_file, input_files):
+	"""
+	Incrementally assembles input_files (.asm) and links them, in order, into
+	output_file: a packed ROM image if it ends with .rom, else a .hack file.
+	"""
+	words = link(load_objects(input_files))
+	if output_file.endswith('.rom'):
+		rom.write(words, output_file)
+	else:
+		rom.write_hack(words, output_file)
+
+if __name__ == '__main__':
+	try:
+		main(sys.argv[1], sys.argv[2:])
+	except LinkError as error:
+		sys.exit(f"LinkError: {error}")
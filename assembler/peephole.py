@@ -0,0 +1,207 @@
+"""
+Optimises Hack assembly programs, such as those written by the VM translator,
+by rewriting redundant instruction sequences. Rewrites are only applied within
+basic blocks: a label may be the target of a jump from anywhere, and a jump
+instruction may transfer control anywhere, so neither is ever looked across.
+Run between translation and assembly. Usage:
+python peephole.py Prog.asm [Prog.opt.asm] (overwrites Prog.asm by default)
+"""
+
+import hack_parser as parser
+import sys
+
+def fields(command):
+	"""
+	Returns the dest, comp, and jump mnemonics of a C-command, using '' for a
+	missing dest or jump.
+	"""
+	dest, jump = '', ''
+	if ';' in command:
+		command, jump = command.split(';')
+	if '=' in command:
+		dest, command = command.split('=')
+	return dest, command, jump
+
+def join(dest, comp, jump):
+	"""
+	Reverses fields().
+	"""
+	return (dest + '=' if dest else '') + comp + (';' + jump if jump else '')
+
+def is_barrier(command):
+	"""
+	Returns true if a basic block ends at the command: i.e., the command is a
+	label, or a C-command with a jump.
+	"""
+	return command[0] == '(' or (command[0] != '@' and ';' in command)
+
+def reads(command, register):
+	"""
+	Returns true if the command reads register ('A' or 'D'). A command reads A
+	if it addresses memory (reads or writes M) or jumps.
+	"""
+	if command[0] == '@':
+		return False
+	dest, comp, jump = fields(command)
+	if register == 'A':
+		return 'A' in comp or 'M' in comp or 'M' in dest or jump != ''
+	return register in comp
+
+def writes(command, register):
+	"""
+	Returns true if the command writes register ('A' or 'D').
+	"""
+	if command[0] == '@':
+		return register == 'A'
+	return register in fields(command)[0]
+
+def is_dead(commands, i, register):
+	"""
+	Returns true if the value written to register ('A' or 'D') by commands[i]
+	is overwritten before it is read. Only looks within the basic block, and
+	treats the value as live at the end of the block.
+	"""
+	for j in range(i + 1, len(commands)):
+		command = commands[j]
+		if command[0] == '(' or reads(command, register):
+			return False
+		if writes(command, register):
+			return True
+		if is_barrier(command):
+			return False
+	return False
+
+def remove_redundant_loads(commands):
+	"""
+	Removes A-instructions that load the value that A already holds, i.e.,
+	@X when A was last written by @X in the same basic block.
+	"""
+	result = []
+	removed = 0
+	loaded = None 		# symbol or number that A is known to hold
+	for command in commands:
+		if command[0] == '(':
+			loaded = None
+		elif command[0] == '@':
+			if command == loaded:
+				removed += 1
+				continue
+			loaded = command
+		elif writes(command, 'A'):
+			loaded = None
+		result.append(command)
+
+	return result, removed
+
+# Sequences of commands that fuse_sequences() replaces, and their replacement.
+# None of them contains a label or a jump, so each lies within a basic block.
+fusions = {
+	# Push then pop: the stack pointer is incremented then decremented
+	('M=M+1', 'AM=M-1'): ('A=M',),
+	('M=M-1', 'AM=M+1'): ('A=M',),
+	('M=M+1', 'M=M-1'): (),
+	('M=M-1', 'M=M+1'): (),
+	# Copies between D and the same M
+	('M=D', 'D=M'): ('M=D',),
+	('D=M', 'M=D'): ('D=M',),
+	# Reloading the address of the top of the stack after writing to it. The
+	# stack pointer never points to itself, so the write can't change it.
+	('@SP', 'A=M', 'M=D', '@SP', 'A=M'): ('@SP', 'A=M', 'M=D'),
+}
+fusion_lengths = sorted({len(pattern) for pattern in fusions}, reverse=True)
+
+def fuse_sequences(commands):
+	"""
+	Replaces sequences of adjacent commands that have a shorter equivalent
+	(see fusions), such as a push immediately followed by a pop.
+	"""
+	result = []
+	saved = 0
+	i = 0
+	while i < len(commands):
+		for length in fusion_lengths:
+			pattern = tuple(commands[i:i + length])
+			if pattern in fusions:
+				result += fusions[pattern]
+				saved += length - len(fusions[pattern])
+				i += length
+				break
+		else:
+			result.append(commands[i])
+			i += 1
+
+	return result, saved
+
+def remove_dead_writes(commands):
+	"""
+	Removes writes to D whose value is never read, and A-instructions whose
+	value is never read, within a basic block. A C-command that also writes A
+	or M keeps those destinations.
+	"""
+	result = []
+	removed = 0
+	for i, command in enumerate(commands):
+		if command[0] == '@':
+			if is_dead(commands, i, 'A'):
+				removed += 1
+				continue
+		elif command[0] != '(':
+			dest, comp, jump = fields(command)
+			if 'D' in dest and not jump and is_dead(commands, i, 'D'):
+				dest = dest.replace('D', '')
+				if not dest:
+					removed += 1
+					continue
+				command = join(dest, comp, jump)
+		result.append(command)
+
+	return result, removed
+
+# Rewrites applied by optimise(), in order
+rewrites = [
+	('redundant A loads', remove_redundant_loads),
+	('fused sequences', fuse_sequences),
+	('dead writes', remove_dead_writes),
+]
+
+def optimise(commands):
+	"""
+	Applies every rewrite to a list of commands (see hack_parser.clean) until
+	none of them saves any more instructions. Returns the optimised list of
+	commands and a dictionary of the ROM words saved by each rewrite.
+	"""
+	saved = {name: 0 for name, _ in rewrites}
+	changed = True
+	while changed:
+		changed = False
+		for name, rewrite in rewrites:
+			commands, count = rewrite(commands)
+			saved[name] += count
+			changed = changed or count > 0
+
+	return commands, saved
+
+def count_words(commands):
+	"""
+	Returns the number of ROM words that a list of commands assembles into.
+	"""
+	return sum(1 for command in commands if command[0] != '(')
+
+def main(input_file, output_file):
+	"""
+	Optimises an .asm file, writes the result to output_file, and reports the
+	number of ROM words saved.
+	"""
+	commands = parser.initialise(input_file)
+	before = count_words(commands)
+	commands, saved = optimise(commands)
+	with open(output_file, 'w') as f:
+		f.write('\n'.join(commands) + '\n')
+
+	after = count_words(commands)
+	print(f'{input_file}: {before} -> {after} ROM words ({before - after} saved)')
+	for name, count in saved.items():
+		print(f'  {name}: {count}')
+
+if __name__ == '__main__':
+	main(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else sys.argv[1])
@@ -0,0 +1,331 @@
+"""
+Profiles Hack machine code as it runs on a BlockEmulator. Instead of counting
+every instruction as it runs, the profiler counts how often each block exits
+after each number of instructions, which costs a dictionary update per block.
+After the run, NumPy expands those counts into an array of execution counts
+indexed by ROM address (each exit stands for the first instructions of the
+block's path), and the array is folded into totals per label and per VM
+function with the source map of the program (see source_map.py).
+
+Calls and returns are found by the label conventions of the VM translator: a
+call jumps to the first instruction of a function (Xxx.yyy) from outside the
+function or from a call site (the jump just before a return address label),
+and its return reaches the instruction after the return address label
+(Xxx.yyy$ret.n). A jump back to a loop label at the start of a function is
+not a call. The profiler keeps a call stack from these, so it can report the
+instructions executed by each function including those of the functions that
+it calls (its inclusive count), and for each call graph edge. Usage:
+python profiler.py Prog.hack [Prog.hackmap|Prog.asm] [--steps N] [--top N]
+"""
+
+import block_emulator, emulator, rom, source_map
+import os
+import sys
+import time
+import numpy as np
+
+# The name under which instructions outside any label or VM function (e.g.,
+# the bootstrap code, and the shared routines that follow it) are counted
+OUTSIDE = '(none)'
+
+def fold(counts, pairs):
+	"""
+	Returns a dictionary of the sum of an array of counts indexed by ROM
+	address over the instructions that belong to each name in a list of (ROM
+	address, name) pairs (see source_map.enclosing). Instructions before the
+	first pair are counted under OUTSIDE.
+	"""
+	starts, names = [0], [OUTSIDE]
+	for address, name in pairs:
+		if address >= len(counts):
+			continue
+		if address == starts[-1]:
+			# Of labels at the same address, the last one encloses it
+			names[-1] = name
+		else:
+			starts.append(address)
+			names.append(name)
+
+	totals = {}
+	for name, total in zip(names, np.add.reduceat(counts, starts)):
+		totals[name] = totals.get(name, 0) + int(total)
+	return totals
+
+class Profiler(block_emulator.BlockEmulator):
+	"""
+	A BlockEmulator that profiles the program it runs, given its source map.
+	Profiles add up over runs until reset() is called.
+	"""
+
+	def __init__(self, words, source_map):
+		"""
+		Loads a sequence of machine words into the ROM, and finds the entries
+		of the functions, the call sites, and the return addresses in the
+		source map.
+		"""
+		self.source_map = source_map
+		self.entries = {address: name for address, name in source_map['functions']}
+		self.call_sites = {
+			address - 1 for address, label in source_map['labels'] if '$ret.' in label
+		}
+		# The bootstrap code ends with the call of Sys.init, so its return
+		# address is that of whatever follows, but Sys.init never returns
+		self.returns = {
+			address: label.split('$ret.')[0]
+			for address, label in source_map['labels']
+			if '$ret.' in label and '$ret.$init.' not in label
+		}
+		super().__init__(words)
+
+	def reset(self):
+		"""
+		Resets the computer, and clears the profile.
+		"""
+		super().reset()
+		self.clock = 0 		# instructions executed since reset
+		self.exits = {} 	# block exits, by start address << 8 | count
+		self.events = {} 	# calls and returns of the exits that make any
+		self.stack = [] 	# (function, clock at entry) for each active call
+		self.active = {} 	# active calls of each function
+		self.calls = {} 	# [calls, inclusive count] by (caller, function)
+		self.previous = None 	# the key of the last block exit, if any
+
+	def is_call(self, previous, function):
+		"""
+		Returns true if reaching the entry of function after the instruction
+		at ROM address previous (None at the start of the program) is a call:
+		i.e., previous is a call site, or isn't in the function.
+		"""
+		if previous is None or previous in self.call_sites:
+			return True
+		return source_map.enclosing(self.source_map['functions'], previous) != function
+
+	def find_events(self, path):
+		"""
+		Returns a tuple of (offset, function, is_call) for each call and
+		return made by the instructions at the ROM addresses in path, where
+		offset is the position of the instruction in path. Whether reaching
+		an entry at offset 0 is a call depends on the block that ran before,
+		so is_call is None for it.
+		"""
+		events = []
+		for offset, address in enumerate(path):
+			if address in self.returns:
+				events.append((offset, self.returns[address], False))
+			if address in self.entries:
+				function = self.entries[address]
+				if offset == 0:
+					events.append((offset, function, None))
+				elif self.is_call(path[offset - 1], function):
+					events.append((offset, function, True))
+		return tuple(events)
+
+	def trace(self, events, clock, previous):
+		"""
+		Updates the call stack with the calls and returns of a block exit that
+		started at the given clock, after the block exit with key previous.
+		"""
+		stack, active = self.stack, self.active
+		for offset, function, is_call in events:
+			if is_call is None:
+				# The last instruction that ran before the block
+				last = None
+				if previous is not None:
+					last = self.blocks[previous >> 8].path[(previous & 0xFF) - 1]
+				if not self.is_call(last, function):
+					continue
+				is_call = True
+			if is_call:
+				stack.append((function, clock + offset))
+				active[function] = active.get(function, 0) + 1
+			elif active.get(function):
+				# Unwind to the call that returned
+				while True:
+					callee, entry = stack.pop()
+					active[callee] -= 1
+					self.count_call(callee, entry, clock + offset)
+					if callee == function:
+						break
+
+	def count_call(self, function, entry, clock):
+		"""
+		Adds a call of function from the one at the top of the stack, which
+		ran from clock entry to clock, to the call graph. A recursive call is
+		counted, but its instructions are already in the inclusive count of
+		the outermost call.
+		"""
+		caller = self.stack[-1][0] if self.stack else OUTSIDE
+		edge = self.calls.setdefault((caller, function), [0, 0])
+		edge[0] += 1
+		if not self.active[function]:
+			edge[1] += clock - entry
+
+	def run(self, max_steps=10 ** 9):
+		"""
+		Runs the program like BlockEmulator.run, and adds it to the profile.
+		Raises EmulatorError if the program addresses RAM out of range.
+		"""
+		blocks, ram, size = self.blocks, self.ram, self.size
+		exits, events = self.exits, self.events
+		a, d, pc = self.a, self.d, self.pc
+		previous = self.previous
+
+		steps = 0
+		try:
+			while steps < max_steps:
+				if pc >= size:
+					steps += 1
+					self.halted = True
+					break
+				block = blocks[pc] or self.compile_block(pc)
+				start = pc
+				a, d, pc, count = block(ram, a, d)
+				key = start << 8 | count
+				if key in exits:
+					exits[key] += 1
+				else:
+					exits[key] = 1
+					found = self.find_events(block.path[:count])
+					if found:
+						events[key] = found
+				if key in events:
+					self.trace(events[key], self.clock + steps, previous)
+				previous = key
+				steps += count
+				if pc < 0:
+					pc = ~pc
+					self.halted = True
+					break
+		except IndexError:
+			raise emulator.EmulatorError(
+				f"a RAM address is out of range in the block that starts at {pc}."
+			)
+
+		self.a, self.d, self.pc = a, d, pc
+		self.previous = previous
+		self.clock += steps
+		return steps
+
+	def counts(self):
+		"""
+		Returns a NumPy array of the number of times that the instruction at
+		each ROM address has been executed.
+		"""
+		if not self.exits:
+			return np.zeros(self.size, dtype=np.int64)
+		paths = [self.blocks[key >> 8].path[:key & 0xFF] for key in self.exits]
+		addresses = np.concatenate([np.array(path, dtype=np.int64) for path in paths])
+		times = np.repeat(
+			np.fromiter(self.exits.values(), dtype=np.int64, count=len(self.exits)),
+			[len(path) for path in paths],
+		)
+		counts = np.zeros(self.size, dtype=np.int64)
+		np.add.at(counts, addresses, times)
+		return counts
+
+	def call_graph(self):
+		"""
+		Returns a dictionary of [calls, inclusive count] by (caller, function)
+		edge of the call graph. Calls that are still active (e.g., Sys.init)
+		are counted up to the current clock.
+		"""
+		calls = {edge: list(values) for edge, values in self.calls.items()}
+		outermost = set()
+		for i, (function, entry) in enumerate(self.stack):
+			caller = self.stack[i - 1][0] if i else OUTSIDE
+			edge = calls.setdefault((caller, function), [0, 0])
+			edge[0] += 1
+			if function not in outermost:
+				outermost.add(function)
+				edge[1] += self.clock - entry
+		return calls
+
+def report(profiler, top=20):
+	"""
+	Returns the text of the flat profile of a Profiler's functions, its
+	hottest labels, and its call graph, listing up to top of each.
+	"""
+	counts = profiler.counts()
+	total = max(int(counts.sum()), 1)
+	functions = fold(counts, profiler.source_map['functions'])
+	labels = fold(counts, profiler.source_map['labels'])
+	graph = profiler.call_graph()
+
+	calls, inclusive = {}, {}
+	for (caller, function), (n, instructions) in graph.items():
+		calls[function] = calls.get(function, 0) + n
+		inclusive[function] = inclusive.get(function, 0) + instructions
+	for function, n in functions.items():
+		# Instructions outside functions have no calls to include
+		inclusive.setdefault(function, n)
+
+	lines = [
+		f'Flat profile ({total} instructions):',
+		'  % self         self      calls    inclusive  function',
+	]
+	for function, n in sorted(functions.items(), key=lambda item: -item[1])[:top]:
+		lines.append(f'{100 * n / total:7.2f} {n:12} {calls.get(function, 0):10} '
+			f'{inclusive[function]:12}  {function}')
+
+	lines += ['', 'Hottest labels:', '  % self         self  label']
+	for label, n in sorted(labels.items(), key=lambda item: -item[1])[:top]:
+		lines.append(f'{100 * n / total:7.2f} {n:12}  {label}')
+
+	lines += ['', 'Call graph (inclusive instructions):']
+	edges = sorted(graph.items(), key=lambda item: -item[1][1])
+	for function in sorted(calls, key=lambda function: -inclusive[function])[:top]:
+		share = 100 * inclusive[function] / total
+		lines.append(f'{function}: {calls[function]} calls, '
+			f'{inclusive[function]} instructions ({share:.2f}%), '
+			f'{functions.get(function, 0)} self')
+		for (caller, callee), (n, instructions) in edges:
+			if callee == function:
+				lines.append(f'    called by {caller}: {n} calls, '
+					f'{instructions} instructions')
+		for (caller, callee), (n, instructions) in edges:
+			if caller == function:
+				lines.append(f'    calls {callee}: {n} calls, '
+					f'{instructions} instructions')
+
+	return '\n'.join(lines)
+
+def load(input_file, map_file=None):
+	"""
+	Returns a Profiler with a .hack file or packed ROM image loaded, and the
+	source map from map_file (a .hackmap file, or the .asm file to build it
+	from). By default, the .hackmap or .asm file next to input_file is used.
+	"""
+	stem = os.path.splitext(input_file)[0]
+	if map_file is None:
+		map_file = stem + '.hackmap'
+		if not os.path.exists(map_file):
+			map_file = stem + '.asm'
+	if map_file.endswith('.hackmap'):
+		program_map = source_map.load(map_file)
+	else:
+		program_map = source_map.build_file(map_file)
+	return Profiler(rom.load_any(input_file), program_map)
+
+if __name__ == '__main__':
+	options = sys.argv[2:]
+	steps = int(options[options.index('--steps') + 1]) if '--steps' in options else None
+	top = int(options[options.index('--top') + 1]) if '--top' in options else 20
+	maps = [option for option in options if option.endswith(('.hackmap', '.asm'))]
+	try:
+		profiler = load(sys.argv[1], maps[0] if maps else None)
+	except rom.FormatError as error:
+		sys.exit(f"FormatError: {error}")
+	if len(profiler.source_map['lines']) != profiler.size:
+		# e.g., the program was assembled with --optimise
+		sys.exit("ProfilerError: the source map does not match the ROM.")
+	start = time.perf_counter()
+	try:
+		executed = profiler.run(steps or 10 ** 9)
+	except emulator.EmulatorError as error:
+		sys.exit(f"EmulatorError: {error}")
+	elapsed = time.perf_counter() - start
+	print(f'{executed} instructions in {elapsed:.3f}s '
+		f'({executed / elapsed / 1e6:.2f} million per second)'
+		+ (', halted' if profiler.halted else ''))
+	print()
+	print(report(profiler, top))
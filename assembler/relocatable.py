@@ -0,0 +1,114 @@
+"""
+Assembles a single .asm file into a relocatable object, so that a program made
+of several .asm files can be assembled one file at a time and linked later (see
+linker.py). In an object, the code is assembled as if it started at ROM[0], and
+everything that depends on the rest of the program is left unresolved: the ROM
+offset of the object, labels declared in other files, and variables.
+"""
+
+import hack_parser as parser, code, symbol_table as st
+import json 	# objects are stored on disk as JSON (.hobj files)
+from array import array
+
+def constructor(name):
+	"""
+	Creates a new empty object. An object is a dictionary with the following
+	keys: 'name' (the name of the .asm file), 'words' (an array('H') of machine
+	words), 'labels' (label -> ROM offset of each label declared in the file),
+	'relocations' (offsets of words that hold a ROM offset, which must be moved
+	by the ROM address of the object), and 'references' (unresolved symbol ->
+	offsets of words that must be patched with the symbol's address). The
+	references are kept in order of first appearance.
+	"""
+	return {
+		'name': name,
+		'words': array('H'),
+		'labels': {},
+		'relocations': array('L'),
+		'references': {},
+	}
+
+def assemble(source, name):
+	"""
+	Assembles source (a string, or an iterable of lines) into an object with
+	the given name. Labels are resolved relative to the start of the object
+	and recorded as relocations, predefined symbols are resolved directly, and
+	all other symbols are recorded as references for the linker.
+	"""
+	if isinstance(source, str):
+		source = source.splitlines()
+	commands = list(parser.clean(source))
+	obj = constructor(name)
+	words = obj['words']
+
+	# Declare labels at their offset from the start of the object
+	ROM_counter = 0
+	for command in commands:
+		if parser.command_type(command) == "L_COMMAND":
+			obj['labels'][parser.symbol(command)] = ROM_counter
+		else:
+			ROM_counter += 1
+
+	predefined = st.initialise(st.constructor())
+	for command in commands:
+		c_type = parser.command_type(command)
+		if c_type == "A_COMMAND":
+			chars = parser.symbol(command)
+			try:
+				words.append(int(chars))
+			except ValueError:
+				if chars in obj['labels']:
+					obj['relocations'].append(len(words))
+					words.append(obj['labels'][chars])
+				elif st.contains(chars, predefined):
+					words.append(st.get_address(chars, predefined))
+				else:
+					# Label in another file, or a variable
+					if chars not in obj['references']:
+						obj['references'][chars] = array('L')
+					obj['references'][chars].append(len(words))
+					words.append(0)
+		elif c_type == "C_COMMAND":
+			words.append(code.c_word(command))
+
+	return obj
+
+def assemble_file(input_file):
+	"""
+	Assembles an .asm file into an object named after the file.
+	"""
+	name = input_file.split('/')[-1].split('.')[0]
+	with open(input_file) as f:
+		return assemble(f, name)
+
+def write(obj, output_file):
+	"""
+	Writes an object to output_file (.hobj) as JSON.
+	"""
+	with open(output_file, 'w') as f:
+		json.dump({
+			'name': obj['name'],
+			'words': obj['words'].tolist(),
+			'labels': obj['labels'],
+			'relocations': obj['relocations'].tolist(),
+			'references': {
+				symbol: offsets.tolist()
+				for symbol, offsets in obj['references'].items()
+			},
+		}, f)
+
+def load(input_file):
+	"""
+	Loads an object from a .hobj file written by write().
+	"""
+	with open(input_file) as f:
+		data = json.load(f)
+
+	obj = constructor(data['name'])
+	obj['words'].extend(data['words'])
+	obj['labels'] = data['labels']
+	obj['relocations'].extend(data['relocations'])
+	for symbol, offsets in data['references'].items():
+		obj['references'][symbol] = array('L', offsets)
+
+	return obj
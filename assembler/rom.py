@@ -0,0 +1,92 @@
+"""
+Writes and loads Hack machine code as a packed binary ROM image, an alternative
+to the textual .hack format that needs no text parsing to load. A ROM image is
+a 12-byte header followed by one little-endian unsigned 16-bit word per
+instruction. The header holds a magic number, the number of words, and a CRC-32
+checksum of the words, all little-endian.
+"""
+
+import mmap 	# mmap.mmap() maps a file into memory without reading it
+import os 		# os.fstat() gives the size of the file before it is mapped
+import struct 	# struct.Struct packs and unpacks the header
+import sys 		# sys.byteorder is the byte order of the host
+import zlib 	# zlib.crc32() computes the checksum of the words
+from array import array
+
+MAGIC = b'HROM'
+HEADER = struct.Struct('<4sII') 	# magic, word count, checksum
+
+class FormatError(ValueError):
+	"""
+	Raised when a file is not a valid packed ROM image.
+	"""
+
+def write(words, output_file):
+	"""
+	Writes words (an array('H') of machine words) to output_file as a ROM
+	image, with a single bulk write. Any existing output_file is overwritten.
+	"""
+	if sys.byteorder == 'big':
+		words = array('H', words)
+		words.byteswap()
+
+	with open(output_file, 'wb') as f:
+		f.write(HEADER.pack(MAGIC, len(words), zlib.crc32(words)))
+		words.tofile(f)
+
+def load(input_file):
+	"""
+	Memory-maps a ROM image and returns its machine words as a sequence of
+	ints (a memoryview on the mapped file). No text is parsed and no words are
+	copied: once the checksum has been verified, the words are used in place.
+	Raises FormatError if the file is not a valid ROM image.
+	"""
+	with open(input_file, 'rb') as f:
+		# An empty file can't be mapped, and has no header anyway
+		if os.fstat(f.fileno()).st_size < HEADER.size:
+			raise FormatError(f"{input_file} is not a packed Hack ROM image.")
+		image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+	magic, count, checksum = HEADER.unpack_from(image)
+	if magic != MAGIC:
+		raise FormatError(f"{input_file} is not a packed Hack ROM image.")
+	payload = memoryview(image)[HEADER.size:HEADER.size + 2 * count]
+	if len(payload) != 2 * count or zlib.crc32(payload) != checksum:
+		raise FormatError(f"{input_file} is truncated or corrupted.")
+
+	if sys.byteorder == 'big':
+		words = array('H', payload.tobytes())
+		words.byteswap()
+		return words
+	return payload.cast('H')
+
+def load_hack(input_file):
+	"""
+	Loads a textual .hack file (one 16-bit binary string per line) into an
+	array('H') of machine words.
+	"""
+	with open(input_file) as f:
+		return array('H', [int(line, 2) for line in f if line.strip()])
+
+def write_hack(words, output_file):
+	"""
+	Writes words (machine words) to output_file as a textual .hack file.
+	"""
+	with open(output_file, 'w') as f:
+		f.write(''.join(f'{word:016b}\n' for word in words))
+
+def is_packed(input_file):
+	"""
+	Returns true if the input file is a packed ROM image (i.e., it starts
+	with the magic number) rather than a textual .hack file.
+	"""
+	with open(input_file, 'rb') as f:
+		return f.read(len(MAGIC)) == MAGIC
+
+def load_any(input_file):
+	"""
+	Loads the machine words of either a packed ROM image or a .hack file.
+	"""
+	if is_packed(input_file):
+		return load(input_file)
+	return load_hack(input_file)
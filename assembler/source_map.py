@@ -0,0 +1,136 @@
+"""
+Builds, writes, and reads source maps: sidecar files (.hackmap) that tie every
+ROM address of an assembled program back to its line in the .asm file, the
+label it follows, and the VM function it belongs to. Functions are recognised
+by the return address labels that the VM translator declares after every call
+(Xxx.yyy$ret.n), so every function that is ever called is known.
+
+A source map is stored as JSON. To keep it small for large programs, line
+numbers and label addresses are stored as differences between neighbours,
+and runs of equal differences are stored as (difference, count) pairs.
+"""
+
+import hack_parser as parser
+import bisect 	# bisect.bisect() finds the label that precedes an address
+import json
+from array import array
+
+def build(lines):
+	"""
+	Builds the source map of an assembly program, given an iterable of its
+	lines. A source map is a dictionary with the following keys: 'lines' (an
+	array of .asm line numbers, indexed by ROM address), 'labels' (a list of
+	(ROM address, label) pairs, in order), and 'functions' (a list of (ROM
+	address, function name) pairs, in order).
+	"""
+	source_map = {'lines': array('L'), 'labels': [], 'functions': []}
+	called = set()
+	for line_number, command in parser.numbered(lines):
+		if parser.command_type(command) == "L_COMMAND":
+			label = parser.symbol(command)
+			source_map['labels'].append((len(source_map['lines']), label))
+			if '$ret.' in label:
+				called.add(label.split('$ret.')[0])
+		else:
+			source_map['lines'].append(line_number)
+
+	source_map['functions'] = [
+		(address, label) for address, label in source_map['labels']
+		if label in called
+	]
+
+	return source_map
+
+def build_file(input_file):
+	"""
+	Builds the source map of an .asm file.
+	"""
+	with open(input_file) as f:
+		return build(f)
+
+def encode_runs(values):
+	"""
+	Delta-encodes a sequence of ints: returns a flat list of (difference,
+	count) pairs, where count consecutive values each differ from the previous
+	value (initially 0) by difference.
+	"""
+	runs = []
+	previous = 0
+	for value in values:
+		difference = value - previous
+		if runs and runs[-2] == difference:
+			runs[-1] += 1
+		else:
+			runs += [difference, 1]
+		previous = value
+
+	return runs
+
+def decode_runs(runs):
+	"""
+	Reverses encode_runs() and returns an array of the original values.
+	"""
+	values = array('L')
+	value = 0
+	for i in range(0, len(runs), 2):
+		difference, count = runs[i], runs[i + 1]
+		if difference == 0:
+			values.extend([value] * count)
+			continue
+		for _ in range(count):
+			value += difference
+			values.append(value)
+
+	return values
+
+def write(source_map, output_file, source=None):
+	"""
+	Writes a source map to output_file (.hackmap), optionally recording the
+	name of the .asm file it was built from.
+	"""
+	with open(output_file, 'w') as f:
+		json.dump({
+			'version': 1,
+			'source': source,
+			'lines': encode_runs(source_map['lines']),
+			'labels': [label for _, label in source_map['labels']],
+			'label_addresses': encode_runs(
+				address for address, _ in source_map['labels']
+			),
+			'functions': [label for _, label in source_map['functions']],
+		}, f, separators=(',', ':'))
+
+def load(input_file):
+	"""
+	Loads a source map from a .hackmap file written by write().
+	"""
+	with open(input_file) as f:
+		data = json.load(f)
+
+	labels = list(zip(decode_runs(data['label_addresses']), data['labels']))
+	functions = set(data['functions'])
+
+	return {
+		'lines': decode_runs(data['lines']),
+		'labels': labels,
+		'functions': [(a, label) for a, label in labels if label in functions],
+	}
+
+def enclosing(pairs, address):
+	"""
+	Returns the name in a list of (ROM address, name) pairs that is declared
+	last at or before the given ROM address, or None.
+	"""
+	i = bisect.bisect_right(pairs, address, key=lambda pair: pair[0])
+	return pairs[i - 1][1] if i else None
+
+def lookup(source_map, address):
+	"""
+	Returns the .asm line number, enclosing label, and enclosing VM function
+	of the instruction at the given ROM address.
+	"""
+	return (
+		source_map['lines'][address],
+		enclosing(source_map['labels'], address),
+		enclosing(source_map['functions'], address),
+	)
@@ -0,0 +1,79 @@
+"""
+Tests of the call detection of profiler.py, on a program whose calls are
+known. Usage:
+python -m pytest test_profiler.py
+"""
+
+import hack_assembler, source_map
+from profiler import Profiler, OUTSIDE, fold
+
+# Calls Main.spin, a function whose loop label is at its entry, then
+# Main.other, with the return address in R15. Only the call from Sys.init is
+# a call of Main.spin: the 65536 jumps back to Main.LOOP aren't.
+program = """
+	@Sys.init
+	0;JMP
+(Sys.init$ret.$init.1)
+(Sys.init)
+	@Main.spin$ret.Sys.1
+	D=A
+	@R15
+	M=D
+	@Main.spin
+	0;JMP
+(Main.spin$ret.Sys.1)
+	@Main.other$ret.Sys.2
+	D=A
+	@R15
+	M=D
+	@Main.other
+	0;JMP
+(Main.other$ret.Sys.2)
+(Sys.END)
+	@Sys.END
+	0;JMP
+(Main.spin)
+(Main.LOOP)
+	@R0
+	M=M-1
+	D=M
+	@Main.LOOP
+	D;JNE
+	@R15
+	A=M
+	0;JMP
+(Main.other)
+	@R15
+	A=M
+	0;JMP
+"""
+
+def profile():
+	"""
+	Returns a Profiler that has run program until it halts.
+	"""
+	profiler = Profiler(
+		hack_assembler.assemble(program),
+		source_map.build(program.splitlines())
+	)
+	profiler.run()
+	return profiler
+
+def test_calls():
+	profiler = profile()
+	calls = {edge: n for edge, (n, _) in profiler.call_graph().items()}
+	assert profiler.halted
+	assert calls == {
+		(OUTSIDE, 'Sys.init'): 1, ('Sys.init', 'Main.spin'): 1,
+		('Sys.init', 'Main.other'): 1,
+	}
+
+def test_returns():
+	# Only Sys.init, which never returns, is left on the call stack
+	assert len(profile().stack) == 1
+
+def test_inclusive_count():
+	# Main.spin calls nothing, so all of its call is its own instructions
+	profiler = profile()
+	spin = fold(profiler.counts(), profiler.source_map['functions'])['Main.spin']
+	assert profiler.call_graph()['Sys.init', 'Main.spin'][1] == spin
@@ -0,0 +1,215 @@
+"""
+Generates synthetic Hack assembly (.asm), VM (.vm), and Jack (.jack) programs
+of a given size for benchmarking the toolchain. The same size, mix, and seed
+always produce the same program, so results of different runs are comparable.
+Generated programs are valid input for the assembler, VM translator, and Jack
+compiler, but are not meant to do anything useful when run.
+"""
+
+import os
+import random
+
+def parse_mix(mix):
+	"""
+	Parses an instruction mix such as "a=4,c=5,label=1" into a dictionary of
+	relative weights.
+	"""
+	weights = {}
+	for item in mix.split(','):
+		name, weight = item.split('=')
+		weights[name.strip()] = float(weight)
+
+	return weights
+
+def choose(rng, weights):
+	"""
+	Returns one of the keys of weights, chosen with probability proportional
+	to its weight.
+	"""
+	return rng.choices(list(weights), list(weights.values()))[0]
+
+# Default instruction mixes: A-instructions, C-instructions, and labels in
+# .asm programs, and command types in .vm programs.
+ASM_MIX = 'a=45,c=50,label=5'
+VM_MIX = 'push=45,pop=20,arithmetic=25,flow=6,call=4'
+
+C_COMMANDS = [
+	'D=A', 'D=M', 'M=D', 'A=M', 'M=M+1', 'M=M-1', 'AM=M-1', 'D=D+M', 'D=M-D',
+	'M=D+M', 'D=D-A', 'A=A-1', 'M=-1', 'M=0', 'D;JEQ', 'D;JGT', 'D;JLT',
+	'0;JMP', 'D;JNE', 'MD=M+1', 'M=!M', 'D=D&M', 'D=D|M', 'A=D+A',
+]
+PREDEFINED = ['SP', 'LCL', 'ARG', 'THIS', 'THAT', 'R13', 'R14', 'R15']
+
+# Words of ROM that an A-instruction can address. Labels declared after the
+# last instruction have the address after it, so a program may have one word
+# less than this.
+ROM_SIZE = 32768
+
+def generate_asm(lines, mix=ASM_MIX, seed=0):
+	"""
+	Returns the text of an .asm program with the given number of lines, or
+	fewer if the program would not fit in the ROM. A quarter of the symbolic
+	A-instructions refer to variables, and the rest refer to labels declared
+	earlier or later in the program.
+	"""
+	rng = random.Random(seed)
+	weights = parse_mix(mix)
+	n_labels = max(1, int(lines * weights.get('label', 0) / sum(weights.values())))
+	declared = 0
+	words = 0
+	out = []
+	while len(out) < lines and words < ROM_SIZE - 1:
+		kind = choose(rng, weights)
+		if kind == 'label' and declared < n_labels:
+			out.append(f'(LABEL_{declared})')
+			declared += 1
+			continue
+		words += 1
+		if kind == 'a':
+			r = rng.random()
+			if r < 0.3:
+				out.append(f'@{rng.randrange(32768)}')
+			elif r < 0.45:
+				out.append('@' + rng.choice(PREDEFINED))
+			elif r < 0.6:
+				out.append(f'@var_{rng.randrange(64)}')
+			else:
+				out.append(f'@LABEL_{rng.randrange(n_labels)}')
+		else:
+			out.append(rng.choice(C_COMMANDS))
+
+	# Declare labels that were referenced but not reached
+	out += [f'(LABEL_{i})' for i in range(declared, n_labels)]
+
+	return '\n'.join(out) + '\n'
+
+def generate_vm(lines, files=4, mix=VM_MIX, seed=0):
+	"""
+	Returns a dictionary of .vm file names and their text, with about the
+	given number of lines in total. Sys.vm declares Sys.init, which calls
+	Main.main, so that the program can be translated with bootstrap code.
+	"""
+	rng = random.Random(seed)
+	weights = parse_mix(mix)
+	segments = ['local', 'argument', 'this', 'that', 'temp', 'static']
+	arithmetic = ['add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not']
+	names = ['Main'] + [f'Class{i}' for i in range(files - 2)]
+	functions = [f'{name}.f{i}' for name in names for i in range(8)]
+
+	programs = {
+		'Sys.vm': 'function Sys.init 0\ncall Main.main 0\nlabel HALT\ngoto HALT\n'
+	}
+	per_file = max(1, lines // len(names))
+	for name in names:
+		out = [f'function {name}.main 2']
+		function = 0
+		labels = 0      # labels declared so far
+		while len(out) < per_file or function < 8:
+			if len(out) % 64 == 0 or out[-1] == 'return':
+				out.append(f'function {name}.f{function} {rng.randrange(5)}')
+				function += 1
+			kind = choose(rng, weights)
+			if kind == 'push':
+				if rng.random() < 0.4:
+					out.append(f'push constant {rng.randrange(32768)}')
+				else:
+					segment = rng.choice(segments)
+					out.append(f'push {segment} {rng.randrange(8)}')
+			elif kind == 'pop':
+				segment = rng.choice(segments + ['pointer'])
+				index = rng.randrange(2 if segment == 'pointer' else 8)
+				out.append(f'pop {segment} {index}')
+			elif kind == 'arithmetic':
+				out.append(rng.choice(arithmetic))
+			elif kind == 'flow':
+				if rng.random() < 0.4:
+					out.append(f'label L{labels}')
+					labels += 1
+				else:
+					goto = rng.choice(['goto', 'if-goto'])
+					out.append(f'{goto} L{rng.randrange(labels + 4)}')
+			elif kind == 'call':
+				out.append(f'call {rng.choice(functions)} {rng.randrange(4)}')
+			if rng.random() < 0.02:
+				out.append('return')
+		out.append('return')
+		# Declare labels that were referenced but not declared
+		out += [f'label L{i}' for i in range(labels, labels + 4)]
+		programs[name + '.vm'] = '\n'.join(out) + '\n'
+
+	return programs
+
+def jack_expression(rng, variables, depth=0):
+	"""
+	Returns a random Jack expression over the given variables.
+	"""
+	if depth > 1 or rng.random() < 0.4:
+		if rng.random() < 0.5:
+			return rng.choice(variables)
+		return str(rng.randrange(100))
+	op = rng.choice(['+', '-', '&', '|', '<', '>', '='])
+	return (
+		jack_expression(rng, variables, depth + 1) + f' {op} ' +
+		jack_expression(rng, variables, depth + 1)
+	)
+
+def jack_statements(rng, variables, functions, count, depth=0):
+	"""
+	Returns a list of lines of random Jack statements.
+	"""
+	out = []
+	indent = '        ' + '    ' * depth
+	for _ in range(count):
+		r = rng.random()
+		if r < 0.5 or depth > 1:
+			out.append(f'{indent}let {rng.choice(variables)} = {jack_expression(rng, variables)};')
+		elif r < 0.65:
+			out.append(f'{indent}while ({jack_expression(rng, variables)}) {{')
+			out += jack_statements(rng, variables, functions, 3, depth + 1)
+			out.append(f'{indent}}}')
+		elif r < 0.85:
+			out.append(f'{indent}if ({jack_expression(rng, variables)}) {{')
+			out += jack_statements(rng, variables, functions, 2, depth + 1)
+			out.append(f'{indent}}} else {{')
+			out += jack_statements(rng, variables, functions, 2, depth + 1)
+			out.append(f'{indent}}}')
+		else:
+			args = ', '.join(jack_expression(rng, variables) for _ in range(2))
+			out.append(f'{indent}do {rng.choice(functions)}({args});')
+
+	return out
+
+def generate_jack(lines, files=4, seed=0):
+	"""
+	Returns a dictionary of .jack file names and their text, with about the
+	given number of lines in total. Only the subset of Jack that the compiler
+	in "compiler 2" supports is used.
+	"""
+	rng = random.Random(seed)
+	names = [f'Class{i}' for i in range(files)]
+	functions = [f'{name}.f{i}' for name in names for i in range(4)]
+	programs = {}
+	per_file = max(1, lines // files)
+	for name in names:
+		out = [f'class {name} {{', '    static int counter;']
+		i = 0
+		while len(out) < per_file or i < 4:
+			out.append(f'    function int f{i}(int a, int b) {{')
+			out.append('        var int x, y, z;')
+			out += jack_statements(rng, ['a', 'b', 'x', 'y', 'z', 'counter'], functions, 12)
+			out.append('        return x;')
+			out.append('    }')
+			i += 1
+		out.append('}')
+		programs[name + '.jack'] = '\n'.join(out) + '\n'
+
+	return programs
+
+def write_files(directory, programs):
+	"""
+	Writes a dictionary of file names and their text to a directory.
+	"""
+	os.makedirs(directory, exist_ok=True)
+	for name, text in programs.items():
+		with open(os.path.join(directory, name), 'w') as f:
+			f.write(text)
@@ -0,0 +1,162 @@
+"""
+Benchmarks every stage of the toolchain on generated programs (see
+generator.py): the Jack compiler ("compiler 2"), the VM translator ("vm 2"),
+and the assembler. Each stage runs as a separate process, exactly as from the
+command line, and is timed with its wall-clock time and peak memory use. The
+results are printed and can be saved as JSON and compared with a baseline:
+
+python run_benchmarks.py [--lines N] [--repeat N] [--asm-mix MIX]
+	[--vm-mix MIX] [--output results.json] [--baseline baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import generator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run(command, cwd):
+	"""
+	Runs a command and returns its wall-clock time (in seconds) and peak
+	resident memory (in KB). Exits if the command fails.
+	"""
+	start = time.perf_counter()
+	pid = os.fork()
+	if pid == 0:
+		try:
+			os.chdir(cwd)
+			devnull = os.open(os.devnull, os.O_WRONLY)
+			os.dup2(devnull, 1)
+			os.execv(command[0], command)
+		finally:
+			os._exit(127)
+	_, status, usage = os.wait4(pid, 0)
+	elapsed = time.perf_counter() - start
+	if status != 0:
+		sys.exit(f"BenchmarkError: {' '.join(command)} failed.")
+
+	return elapsed, usage.ru_maxrss
+
+def count_lines(directory, extension):
+	"""
+	Returns the total number of lines in the files of a directory that have
+	the given extension.
+	"""
+	total = 0
+	for name in os.listdir(directory):
+		if name.endswith(extension):
+			with open(os.path.join(directory, name)) as f:
+				total += sum(1 for _ in f)
+
+	return total
+
+def stages(workdir, args):
+	"""
+	Generates the input of every stage in workdir, and returns a list of
+	(stage name, command, number of input lines) tuples.
+	"""
+	python = sys.executable
+	generator.write_files(
+		os.path.join(workdir, 'jack'), generator.generate_jack(args.lines // 4)
+	)
+	generator.write_files(
+		os.path.join(workdir, 'vm'), generator.generate_vm(args.lines, mix=args.vm_mix)
+	)
+	generator.write_files(
+		workdir, {'prog.asm': generator.generate_asm(args.lines, args.asm_mix)}
+	)
+	# The .asm program may be cut short to fit in the ROM
+	asm_lines = count_lines(workdir, '.asm')
+	compiler = os.path.join(ROOT, 'compiler 2', 'jack_compiler.py')
+	translator = os.path.join(ROOT, 'vm 2', 'vm_translator.py')
+	assembler = os.path.join(ROOT, 'assembler', 'hack_assembler.py')
+
+	return [
+		('jack_compiler', [python, compiler, 'jack'],
+			count_lines(os.path.join(workdir, 'jack'), '.jack')),
+		('vm_translator', [python, translator, './vm'],
+			count_lines(os.path.join(workdir, 'vm'), '.vm')),
+		('assembler', [python, assembler, 'prog.asm'], asm_lines),
+		('assembler_stream', [python, assembler, 'prog.asm', '--stream'], asm_lines),
+	]
+
+def benchmark(args):
+	"""
+	Runs every stage args.repeat times, and returns a dictionary of results,
+	keeping the fastest run of each stage.
+	"""
+	results = {
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'lines': args.lines,
+		'asm_mix': args.asm_mix,
+		'vm_mix': args.vm_mix,
+		'stages': {},
+	}
+	with tempfile.TemporaryDirectory() as workdir:
+		for name, command, lines in stages(workdir, args):
+			runs = [run(command, workdir) for _ in range(args.repeat)]
+			seconds = min(elapsed for elapsed, _ in runs)
+			results['stages'][name] = {
+				'lines': lines,
+				'seconds': round(seconds, 4),
+				'lines_per_sec': round(lines / seconds),
+				'peak_memory_kb': max(memory for _, memory in runs),
+			}
+
+	return results
+
+def report(results, baseline=None):
+	"""
+	Prints a table of results, with the speed and memory of each stage
+	relative to the baseline if one is given.
+	"""
+	print(f"{'stage':<18}{'lines':>10}{'seconds':>10}{'lines/s':>12}{'peak KB':>10}", end='')
+	print(f"{'speed':>9}{'memory':>9}" if baseline else '')
+	for name, stage in results['stages'].items():
+		print(
+			f"{name:<18}{stage['lines']:>10}{stage['seconds']:>10.3f}"
+			f"{stage['lines_per_sec']:>12,}{stage['peak_memory_kb']:>10}", end=''
+		)
+		old = baseline['stages'].get(name) if baseline else None
+		if old:
+			print(
+				f"{stage['lines_per_sec'] / old['lines_per_sec']:>8.2f}x"
+				f"{stage['peak_memory_kb'] / old['peak_memory_kb']:>8.2f}x"
+			)
+		else:
+			print()
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+	parser.add_argument('--lines', type=int, default=100000,
+		help='size of the generated programs (in lines); the .asm program is '
+		'cut short to fit in the 32K-word ROM')
+	parser.add_argument('--repeat', type=int, default=3,
+		help='number of runs of each stage (the fastest is kept)')
+	parser.add_argument('--asm-mix', default=generator.ASM_MIX,
+		help='relative weights of a, c, and label lines in the .asm program')
+	parser.add_argument('--vm-mix', default=generator.VM_MIX,
+		help='relative weights of push, pop, arithmetic, flow, and call commands')
+	parser.add_argument('--output', help='file to save the results to (JSON)')
+	parser.add_argument('--baseline', help='results (JSON) to compare with')
+	args = parser.parse_args()
+
+	results = benchmark(args)
+	baseline = None
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+	report(results, baseline)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent=4)
+
+if __name__ == '__main__':
+	main()
@@ -1,7 +1,6 @@
 import os       # os.listdir() returns everything in a directory
 import re       # re.split(pattern, string) splits string by pattern  
 import sys      # sys.exit() raised on syntax error
-import uuid     # module used to generate unique IDs for VM labels
 from helpers import collapse_string_constants
 
 
@@ -126,6 +125,7 @@ class CompilationEngine:
         self.tokeniser = tokeniser
         self.vm_writer = vm_writer
         self.symbol_table = symbol_table
+        self.label_count = 0
         
     def eat(self, expected_tokens):
         """
@@ -172,9 +172,12 @@ class CompilationEngine:
 
     def get_id(self):
         """
-        Generates a 3-character ID to ensure that all VM labels are unique. 
+        Generates an ID to ensure that all VM labels in the class are unique.
+        IDs are numbered in order, so the same class always compiles to the
+        same VM code.
         """
-        return uuid.uuid4().hex[:3]
+        self.label_count += 1
+        return str(self.label_count)
 
     def get_methods(self):
         """
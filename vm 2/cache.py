@@ -0,0 +1,97 @@
+"""
+An on-disk cache of translated .vm files, so that rebuilding a program only
+translates the files that have changed (e.g., an app, but not the OS). Each
+file's assembly code is stored under the SHA-256 hash of everything its
+translation depends on: the contents and name of the file, the options, and
+the source code of the translator itself. Entries are never invalidated, only
+evicted: once the cache grows beyond its size limit, the least recently used
+entries are deleted.
+"""
+
+import call_graph
+import hashlib
+import inliner
+import os
+import optimiser
+import utils
+
+# Hash of the translator's source code, so that changing the translator
+# never reuses assembly code written by an older version. vm_translator.py
+# (which imports this module) and this module are read by path.
+source_hash = hashlib.sha256()
+here = os.path.dirname(os.path.abspath(__file__))
+sources = [module.__file__ for module in [utils, optimiser, call_graph, inliner]]
+sources += [os.path.join(here, name) for name in ['vm_translator.py', 'cache.py']]
+for source in sources:
+	with open(source, 'rb') as f:
+		source_hash.update(f.read())
+translator_version = source_hash.hexdigest()
+
+def key(vm_file, modes=(), removed=(), plan=None):
+	"""
+	Returns the cache key (a hex string) of the translation of a .vm file,
+	given the options that change the code written (e.g., '--compact'), the
+	names of any of its functions that are left out, and the functions that
+	are inlined (see vm_translator.inline_plan). The file name is included
+	because static variables and labels are named after it.
+	"""
+	h = hashlib.sha256(translator_version.encode())
+	h.update(f'{os.path.basename(vm_file)}\0{" ".join(modes)}\0'.encode())
+	h.update(('\0'.join(removed) + '\0').encode())
+	h.update(repr(sorted(plan.items()) if plan else None).encode())
+	with open(vm_file, 'rb') as f:
+		h.update(f.read())
+
+	return h.hexdigest()
+
+def get(cache_dir, key):
+	"""
+	Returns the cached assembly code with the given key, or None if it isn't
+	in the cache. A hit marks the entry as recently used.
+	"""
+	path = os.path.join(cache_dir, key + '.asm')
+	try:
+		with open(path) as f:
+			asm_code = f.read()
+	except FileNotFoundError:
+		return None
+	os.utime(path)
+
+	return asm_code
+
+def put(cache_dir, key, asm_code):
+	"""
+	Stores assembly code in the cache under the given key. The entry is
+	written to a temporary file and renamed, so that a concurrent build never
+	reads a partly written entry.
+	"""
+	os.makedirs(cache_dir, exist_ok=True)
+	path = os.path.join(cache_dir, key + '.asm')
+	with open(f'{path}.{os.getpid()}.tmp', 'w') as f:
+		f.write(asm_code)
+	os.replace(f'{path}.{os.getpid()}.tmp', path)
+
+def evict(cache_dir, max_size):
+	"""
+	Deletes the least recently used entries (by modification time) until the
+	cache takes up at most max_size bytes. Returns the number of entries
+	deleted.
+	"""
+	if not os.path.isdir(cache_dir):
+		return 0
+	entries = []
+	for entry in os.scandir(cache_dir):
+		if entry.name.endswith('.asm'):
+			stat = entry.stat()
+			entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+	size = sum(entry_size for _, entry_size, _ in entries)
+	deleted = 0
+	for _, entry_size, path in sorted(entries):
+		if size <= max_size:
+			break
+		os.remove(path)
+		size -= entry_size
+		deleted += 1
+
+	return deleted
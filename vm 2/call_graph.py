@@ -0,0 +1,69 @@
+"""
+Finds the functions of a VM program that can never run, so that they are not
+translated. The call graph is built from the function and call commands of
+every file, and is walked from Sys.init, which the bootstrap code calls;
+functions that aren't reached (e.g., OS classes that the program never uses)
+are dead. VM labels are local to their function, so a function's commands are
+never jumped to from elsewhere, and removing it can't break the others.
+"""
+
+from utils import CommandType
+
+def split_functions(commands):
+	"""
+	Splits a list of commands into a dictionary of lists of commands by
+	function name, in order. Commands before the first function command are
+	kept under None.
+	"""
+	functions = {None: []}
+	name = None
+	for command in commands:
+		if command.type == CommandType.FUNCTION:
+			name = command.arg1
+			functions[name] = []
+		functions[name].append(command)
+
+	return functions
+
+def build(command_lists):
+	"""
+	Returns the call graph of a program, given a list of the command lists of
+	its files: a dictionary of the set of functions called by each function.
+	"""
+	graph = {}
+	for commands in command_lists:
+		for name, body in split_functions(commands).items():
+			graph[name] = {c.arg1 for c in body if c.type == CommandType.CALL}
+
+	return graph
+
+def reachable(graph, root='Sys.init'):
+	"""
+	Returns the set of functions that can be reached from root in a call
+	graph, including root.
+	"""
+	found = {root}
+	stack = [root]
+	while stack:
+		for callee in graph.get(stack.pop(), ()):
+			if callee not in found:
+				found.add(callee)
+				stack.append(callee)
+
+	return found
+
+def prune(commands, live):
+	"""
+	Removes the functions that aren't in the set live from a list of
+	commands. Returns the remaining commands, and a dictionary of the
+	commands of each removed function by name.
+	"""
+	kept = []
+	removed = {}
+	for name, body in split_functions(commands).items():
+		if name is None or name in live:
+			kept += body
+		else:
+			removed[name] = body
+
+	return kept, removed
@@ -0,0 +1,208 @@
+"""
+Inlines small VM functions at their call sites, so that tiny getters and
+wrappers don't pay for a call and return (dozens of instructions each) around
+a few instructions of work. The body of the called function is copied in
+place of the call, with its argument and local segments moved to spare local
+variables of the caller: the arguments are popped into them, the locals are
+zeroed, and every return jumps to the end of the copy, leaving the return
+value on the stack as a call would. A called function can be inlined if:
+- it is short (see candidates);
+- it can't call itself, directly or indirectly;
+- it leaves exactly one value on its stack at every return;
+- it doesn't use the static segment of a different file than the caller's.
+Functions that change pointer 0 or 1 get them saved and restored, as a
+call would. Inlining is a single level: copied bodies are never inlined into.
+"""
+
+from utils import Command, CommandType
+import call_graph
+
+binary = ['add', 'sub', 'and', 'or', 'eq', 'gt', 'lt']
+
+def stack_effect(command):
+	"""
+	Returns the change in the depth of the stack caused by a command (other
+	than function and return).
+	"""
+	if command.type == CommandType.PUSH:
+		return 1
+	if command.type in [CommandType.POP, CommandType.IF]:
+		return -1
+	if command.type == CommandType.ARITHMETIC and command.arg1 in binary:
+		return -1
+	if command.type == CommandType.CALL:
+		return 1 - command.arg2
+	return 0
+
+def is_balanced(body):
+	"""
+	Returns true if every path through the body of a function (its commands
+	after the function command) ends in a return with exactly one value on
+	the function's stack, never pops more than it pushed, and reaches every
+	label with the same stack depth.
+	"""
+	labels = {c.arg1: i for i, c in enumerate(body) if c.type == CommandType.LABEL}
+	depth = {0: 0}
+	work = [0]
+	while work:
+		i = work.pop()
+		if i >= len(body):
+			return False
+		command = body[i]
+		if command.type == CommandType.RETURN:
+			if depth[i] != 1:
+				return False
+			continue
+		d = depth[i] + stack_effect(command)
+		if d < 0:
+			return False
+		if command.type == CommandType.GOTO:
+			targets = [labels.get(command.arg1)]
+		elif command.type == CommandType.IF:
+			targets = [labels.get(command.arg1), i + 1]
+		else:
+			targets = [i + 1]
+		for target in targets:
+			if target is None:
+				return False
+			if target not in depth:
+				depth[target] = d
+				work.append(target)
+			elif depth[target] != d:
+				return False
+
+	return True
+
+def uses_static(body):
+	"""
+	Returns true if the body of a function uses the static segment.
+	"""
+	return any(
+		c.arg1 == 'static' for c in body
+		if c.type in [CommandType.PUSH, CommandType.POP]
+	)
+
+def pointers(body):
+	"""
+	Returns the sorted indices of the pointer segment that the body of a
+	function pops to (i.e., whether it changes THIS and THAT).
+	"""
+	return sorted({
+		c.arg2 for c in body if c.type == CommandType.POP and c.arg1 == 'pointer'
+	})
+
+def candidates(functions, graph, threshold):
+	"""
+	Returns the functions that can be inlined, given a dictionary of the
+	(file name, commands) of every function and the program's call graph:
+	a dictionary of the (file name, commands) of functions with at most
+	threshold commands that are balanced and can't call themselves.
+	"""
+	found = {}
+	for name, (filename, commands) in functions.items():
+		body = commands[1:]
+		if (
+			len(body) <= threshold and is_balanced(body)
+			and not any(name in call_graph.reachable(graph, c) for c in graph[name])
+		):
+			found[name] = (filename, commands)
+
+	return found
+
+def can_inline(plan, name, filename):
+	"""
+	Returns true if function name is in plan (see candidates) and can be
+	inlined into the file filename.
+	"""
+	if name not in plan:
+		return False
+	callee_file, commands = plan[name]
+	return callee_file == filename or not uses_static(commands)
+
+def frame_size(commands, num_args):
+	"""
+	Returns the number of spare locals needed to inline a function: one for
+	each argument and local, and one for each pointer it saves.
+	"""
+	return num_args + commands[0].arg2 + len(pointers(commands[1:]))
+
+def expand(name, commands, num_args, first, site):
+	"""
+	Returns the commands that replace call name num_args, given the commands
+	of the called function, where first is the first spare local of the
+	caller and site is a number that makes the copy's labels unique within
+	the caller's file.
+	"""
+	body = commands[1:]
+	num_locals = commands[0].arg2
+	saved = pointers(body)
+	segments = {'argument': first, 'local': first + num_args}
+	end = f'{name}$inline.{site}'
+
+	expanded = [Command(CommandType.POP, 'local', first + i) for i in reversed(range(num_args))]
+	for i in range(num_locals):
+		expanded += [
+			Command(CommandType.PUSH, 'constant', 0),
+			Command(CommandType.POP, 'local', first + num_args + i),
+		]
+	slots = {p: first + num_args + num_locals + i for i, p in enumerate(saved)}
+	for p, slot in slots.items():
+		expanded += [
+			Command(CommandType.PUSH, 'pointer', p), Command(CommandType.POP, 'local', slot)
+		]
+
+	returns = 0
+	for i, command in enumerate(body):
+		if command.type in [CommandType.PUSH, CommandType.POP] and command.arg1 in segments:
+			command = Command(
+				command.type, 'local', segments[command.arg1] + command.arg2
+			)
+		elif command.type in [CommandType.LABEL, CommandType.GOTO, CommandType.IF]:
+			command = Command(command.type, f'{command.arg1}${end}', None)
+		elif command.type == CommandType.RETURN:
+			if i == len(body) - 1:
+				continue
+			command = Command(CommandType.GOTO, end, None)
+			returns += 1
+		expanded.append(command)
+
+	if returns:
+		expanded.append(Command(CommandType.LABEL, end, None))
+	for p, slot in slots.items():
+		expanded += [
+			Command(CommandType.PUSH, 'local', slot), Command(CommandType.POP, 'pointer', p)
+		]
+
+	return expanded
+
+def inline(commands, plan, filename):
+	"""
+	Inlines the functions in plan (see candidates) at their call sites in a
+	list of commands of the file filename. Returns the new list of commands
+	and the number of call sites inlined.
+	"""
+	result = []
+	sites = 0
+	for name, body in call_graph.split_functions(commands).items():
+		calls = [
+			c for c in body
+			if c.type == CommandType.CALL and can_inline(plan, c.arg1, filename)
+		]
+		if name is None or not calls:
+			result += body
+			continue
+
+		# Every copy uses the same spare locals, after the caller's own
+		first = body[0].arg2
+		spare = max(frame_size(plan[c.arg1][1], c.arg2) for c in calls)
+		result.append(Command(CommandType.FUNCTION, name, first + spare))
+		for command in body[1:]:
+			if command.type == CommandType.CALL and can_inline(plan, command.arg1, filename):
+				sites += 1
+				result += expand(
+					command.arg1, plan[command.arg1][1], command.arg2, first, sites
+				)
+			else:
+				result.append(command)
+
+	return result, sites
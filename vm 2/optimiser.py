@@ -0,0 +1,176 @@
+"""
+Optimises parsed VM commands (see utils.Command) before code generation, by
+rewriting short runs of commands that the stack machine would execute one by
+one: constant expressions are folded, pushes of 1 followed by add or sub
+become increments, push/pop pairs become direct memory-to-memory moves
+(C_MOVE), and push/pop pairs that cancel are removed. Rewrites only look at
+adjacent commands, and labels are commands, so control flow never enters the
+middle of a rewritten run.
+"""
+
+from utils import Command, CommandType
+
+def is_constant(command):
+	"""
+	Returns true if the command pushes a constant.
+	"""
+	return command.type == CommandType.PUSH and command.arg1 == 'constant'
+
+def constant(value):
+	"""
+	Returns a command that pushes value, as a 16-bit word (0 to 65535).
+	"""
+	return Command(CommandType.PUSH, 'constant', value & 0xFFFF)
+
+def difference(x, y):
+	"""
+	Returns x - y as a signed 16-bit value, which is what the translated code
+	compares with 0 for eq, gt, and lt.
+	"""
+	d = (x - y) & 0xFFFF
+	return d - 0x10000 if d & 0x8000 else d
+
+# Arithmetic commands on constants, and their results (true is -1)
+binary = {
+	'add': lambda x, y: x + y,
+	'sub': lambda x, y: x - y,
+	'and': lambda x, y: x & y,
+	'or': lambda x, y: x | y,
+	'eq': lambda x, y: -(difference(x, y) == 0),
+	'gt': lambda x, y: -(difference(x, y) > 0),
+	'lt': lambda x, y: -(difference(x, y) < 0),
+}
+unary = {
+	'neg': lambda x: -x,
+	'not': lambda x: ~x,
+	'inc': lambda x: x + 1,
+	'dec': lambda x: x - 1,
+}
+
+def fold_constants(commands):
+	"""
+	Replaces arithmetic on pushed constants with a push of the result.
+	"""
+	result = []
+	folded = 0
+	for command in commands:
+		if (
+			command.type == CommandType.ARITHMETIC and command.arg1 in binary
+			and len(result) > 1 and is_constant(result[-1]) and is_constant(result[-2])
+		):
+			y, x = result.pop().arg2, result.pop().arg2
+			command = constant(binary[command.arg1](x, y))
+			folded += 1
+		elif (
+			command.type == CommandType.ARITHMETIC and command.arg1 in unary
+			and result and is_constant(result[-1])
+		):
+			command = constant(unary[command.arg1](result.pop().arg2))
+			folded += 1
+		result.append(command)
+
+	return result, folded
+
+def fold_branches(commands):
+	"""
+	Replaces an if-goto that follows a pushed constant with a goto if the
+	constant is true (not 0), and removes it otherwise.
+	"""
+	result = []
+	folded = 0
+	for command in commands:
+		if command.type == CommandType.IF and result and is_constant(result[-1]):
+			if result.pop().arg2 == 0:
+				folded += 1
+				continue
+			command = Command(CommandType.GOTO, command.arg1, None)
+			folded += 1
+		result.append(command)
+
+	return result, folded
+
+def use_increments(commands):
+	"""
+	Replaces push constant 1 followed by add or sub with inc or dec, which
+	change the top of the stack in place.
+	"""
+	result = []
+	replaced = 0
+	for command in commands:
+		if (
+			command.type == CommandType.ARITHMETIC and command.arg1 in ['add', 'sub']
+			and result and result[-1] == constant(1)
+		):
+			result.pop()
+			command = Command(
+				CommandType.ARITHMETIC, 'inc' if command.arg1 == 'add' else 'dec', None
+			)
+			replaced += 1
+		result.append(command)
+
+	return result, replaced
+
+def remove_cancelling_pairs(commands):
+	"""
+	Removes a push immediately followed by a pop of the same location, which
+	leaves both the stack and memory unchanged.
+	"""
+	result = []
+	removed = 0
+	for command in commands:
+		if (
+			command.type == CommandType.POP and result
+			and result[-1] == Command(CommandType.PUSH, command.arg1, command.arg2)
+		):
+			result.pop()
+			removed += 1
+			continue
+		result.append(command)
+
+	return result, removed
+
+def fuse_moves(commands):
+	"""
+	Replaces a push immediately followed by a pop with a C_MOVE command, which
+	copies the pushed value straight to the popped location without using the
+	stack. arg1 and arg2 of a C_MOVE are (segment, index) pairs of the source
+	and destination.
+	"""
+	result = []
+	fused = 0
+	for command in commands:
+		if command.type == CommandType.POP and result and result[-1].type == CommandType.PUSH:
+			source = result.pop()
+			command = Command(
+				CommandType.MOVE, (source.arg1, source.arg2), (command.arg1, command.arg2)
+			)
+			fused += 1
+		result.append(command)
+
+	return result, fused
+
+# Rewrites applied by optimise(), in order
+rewrites = [
+	('constant folding', fold_constants),
+	('constant branches', fold_branches),
+	('increments', use_increments),
+	('cancelling push/pop', remove_cancelling_pairs),
+	('memory moves', fuse_moves),
+]
+
+def optimise(commands):
+	"""
+	Applies every rewrite to a list of commands until none of them changes
+	anything. Returns the optimised list of commands and a dictionary of the
+	number of times each rewrite was applied.
+	"""
+	hits = {name: 0 for name, _ in rewrites}
+	changed = True
+	while changed:
+		changed = False
+		for name, rewrite in rewrites:
+			commands, count = rewrite(commands)
+			hits[name] += count
+			changed = changed or count > 0
+
+	return commands, hits
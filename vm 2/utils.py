@@ -1,5 +1,31 @@
-import uuid 	# module used to generate unique ID for type_2_binary labels 
 import os 		# os.listdir() returns everything in a directory
+from collections import namedtuple 	# lightweight records for parsed commands
+from enum import Enum
+
+class CommandType(str, Enum):
+	"""
+	The nine types of VM command, and C_MOVE, which optimiser.py fuses from a
+	push and a pop. Members are strings equal to the command type names used
+	throughout this module (e.g., CommandType.PUSH == 'C_PUSH').
+	"""
+	ARITHMETIC = 'C_ARITHMETIC'
+	PUSH = 'C_PUSH'
+	POP = 'C_POP'
+	LABEL = 'C_LABEL'
+	GOTO = 'C_GOTO'
+	IF = 'C_IF'
+	FUNCTION = 'C_FUNCTION'
+	RETURN = 'C_RETURN'
+	CALL = 'C_CALL'
+	MOVE = 'C_MOVE'
+
+
+# A parsed VM command: its type, first argument (the command itself if type is
+# C_ARITHMETIC, else a segment, label, or function name, or None if type is
+# C_RETURN), and second argument (an int, or None if there isn't one). Both
+# arguments of a C_MOVE are (segment, index) pairs: its source and destination.
+Command = namedtuple('Command', ['type', 'arg1', 'arg2'])
+
 
 class Parser():
 	"""
@@ -8,56 +34,85 @@ class Parser():
 	whitespace and comments.
 	"""
 
-	def __init__(self, input_file):
-		"""
-		Creates a list of VM commands based on an input file and makes this 
-		available as an attribute (.commands) of an instance of Parser. Removes 
+	# Command types by the first term of a command
+	command_types = {
+		'add': CommandType.ARITHMETIC, 'sub': CommandType.ARITHMETIC,
+		'neg': CommandType.ARITHMETIC, 'eq': CommandType.ARITHMETIC,
+		'gt': CommandType.ARITHMETIC, 'lt': CommandType.ARITHMETIC,
+		'and': CommandType.ARITHMETIC, 'or': CommandType.ARITHMETIC,
+		'not': CommandType.ARITHMETIC, 'push': CommandType.PUSH,
+		'pop': CommandType.POP, 'label': CommandType.LABEL,
+		'goto': CommandType.GOTO, 'if-goto': CommandType.IF,
+		'function': CommandType.FUNCTION, 'return': CommandType.RETURN,
+		'call': CommandType.CALL,
+	}
+
+	def __init__(self, input_file, commands=None):
+		"""
+		Creates a list of parsed VM commands (see Command) based on an input 
+		file and makes this available as an attribute (.commands) of an 
+		instance of Parser. Each line is tokenised exactly once. Removes 
 		comments, whitespace, and newline characters from the input file. 
+		If a list of commands is given, it is used instead, and input_file
+		is only used for its name.
+		"""
+		if commands is None:
+			with open(input_file) as f:
+				lines = [l.split('/')[0].strip() for l in f]
+			commands = [self.tokenise(l) for l in lines if l]
+
+		self.commands = commands
+		self.current = 0 	# index of the 'current' command
+		self.filename = os.path.splitext(os.path.basename(input_file))[0]
+
+	def tokenise(self, line):
 		"""
-		with open(input_file) as f:
-			lines = [
-				l.split('/')[0].strip() 
-				for l in f 
-				if l[0] != '/' 
-				and l.strip() != ''
-			]
+		Splits a line of VM code into a Command.
+		"""
+		terms = line.split()
+		command_type = self.command_types[terms[0]]
+
+		if command_type == CommandType.ARITHMETIC:
+			return Command(command_type, terms[0], None)
+		elif command_type == CommandType.RETURN:
+			return Command(command_type, None, None)
+		elif len(terms) > 2:
+			return Command(command_type, terms[1], int(terms[2]))
+		else:
+			return Command(command_type, terms[1], None)
 
-		self.commands = lines
-		self.filename = input_file.split('.')[0].split('/')[-1]
+	def __iter__(self):
+		"""
+		Iterates over the parsed commands from the 'current' command onward.
+		"""
+		return iter(self.commands[self.current:])
+
+	def peek(self, offset=1):
+		"""
+		Returns the command offset places after the 'current' command, or None 
+		if there isn't one.
+		"""
+		i = self.current + offset
+		return self.commands[i] if i < len(self.commands) else None
 
 	def has_more_commands(self):
 		"""
 		Returns true if there are more commands in the input.
 		"""
-		if len(self.commands) > 0:
-			return True
+		return self.current < len(self.commands)
 
 	def advance(self):
 		"""
-		Deletes the first command from self.commands, simulating advance 
-		through the input_file. Only called if has_more_commands() is true.
+		Moves on to the next command, simulating advance through the 
+		input_file. Only called if has_more_commands() is true.
 		"""
-		del self.commands[0]
+		self.current += 1
 
 	def command_type(self):
 		"""
-		Returns the type of the 'current' VM command (i.e., self.commands[0]).
+		Returns the type of the 'current' VM command.
 		"""
-		arithmetic_logic_commands = [
-			'add', 'sub', 'neg', 'eq',
-			'gt', 'lt', 'and', 'or', 'not'
-		]
-
-		# First term/symbol in command determines type, so grab this 
-		first_term = self.commands[0].split()[0]
-
-		# Use first_term to create the nine command types
-		if first_term in arithmetic_logic_commands:
-			return 'C_ARITHMETIC'
-		elif first_term == 'if-goto':
-			return 'C_IF'
-		else:
-			return 'C_' + first_term.upper()
+		return self.commands[self.current].type
 
 	def arg1(self):
 		"""
@@ -65,17 +120,14 @@ class Parser():
 		called if command_type is C_RETURN, and the command itself is
 		returned if command_type is C_ARITHMETIC
 		"""
-		return (
-			self.commands[0] if self.command_type() == 'C_ARITHMETIC' 
-			else self.commands[0].split()[1] 
-		)
+		return self.commands[self.current].arg1
 
 	def arg2(self):
 		"""
-		Returns the second argument of the current VM command. Called only if
-		command_type is C_PUSH, C_POP, C_FUNCTION, or C_CALL.
+		Returns the second argument (an int) of the current VM command. Called 
+		only if command_type is C_PUSH, C_POP, C_FUNCTION, or C_CALL.
 		"""
-		return self.commands[0].split()[2]
+		return self.commands[self.current].arg2
 
 
 class CodeWriter():
@@ -84,24 +136,51 @@ class CodeWriter():
 	Conforms to the Standard VM Mapping on the Hack Platform.
 	"""
 
-	def __init__(self, output_file):
+	def __init__(self, output_file, compact=False):
 		"""
 		All newly_created class instances have an open .asm output_file,
-		available as an attribute (.output_file). 
-		"""
-		self.output_file = open(output_file, 'w')
+		available as an attribute (.output_file). output_file is either the
+		name of the file to open, or a file object that is already open
+		(e.g., an io.StringIO buffer). If compact is true, calls and returns
+		jump to global routines instead of being inlined, which trades a few
+		instructions per call for a much smaller ROM.
+		"""
+		if isinstance(output_file, str):
+			output_file = open(output_file, 'w')
+		self.output_file = output_file
+		self.compact = compact
+		self.routines_written = False
+
+		# Labels generated before the first vm file (i.e., by the bootstrap
+		# code) are numbered as if they came from a file named $init, which
+		# can't clash with a vm file because '$' isn't allowed in names
+		self.filename = '$init'
+		self.label_count = 0
 
 	def close(self):
 		"""
-		Closes the .asm output_file.
+		Closes the .asm output_file. Ensures that the global routines have
+		been written.
 		"""
+		if not self.routines_written:
+			self.write_routines()
 		self.output_file.close()
 
 	def set_filename(self, new_input_file):
 		"""
 		Called when the translation of a new vm file has started.
 		"""
-		self.filename = new_input_file.split('.')[0].split('/')[-1]
+		self.filename = os.path.splitext(os.path.basename(new_input_file))[0]
+		self.label_count = 0
+
+	def get_id(self):
+		"""
+		Returns an identifier that makes generated labels unique: the name of
+		the current vm file and a counter that restarts for every file, so the
+		labels of a file (and the .asm code) are the same on every run.
+		"""
+		self.label_count += 1
+		return f'{self.filename}.{self.label_count}'
 
 	def write_init(self):
 		"""
@@ -111,6 +190,50 @@ class CodeWriter():
 		self.output_file.write('@256\nD=A\n@SP\nM=D\n')
 		self.write_call('Sys.init', '0')
 
+		# Sys.init never returns, so the global routines can follow it
+		self.write_routines()
+
+	def write_routines(self):
+		"""
+		Writes the global comparison routines, which every eq, gt, and lt
+		command jumps to, and in compact mode the global call and return
+		routines. ($CALL) expects the return address in D, the address of the
+		called function in R13, and the number of arguments in R14. ($RETURN)
+		is jumped to by every return command.
+		"""
+		asm_code = ''
+		if self.compact:
+			asm_code += '($CALL)\n'
+
+			# Push the return address, then the caller's saved state
+			asm_code += '@SP\nA=M\nM=D\n@SP\nM=M+1\n'
+			for i in ['LCL', 'ARG', 'THIS', 'THAT']:
+				asm_code += f'@{i}\nD=M\n@SP\nA=M\nM=D\n@SP\nM=M+1\n'
+
+			# ARG = M[SP] - (num_args + 5), LCL = M[SP], then jump to the
+			# function
+			asm_code += '@R14\nD=M\n@5\nD=D+A\n@SP\nD=M-D\n@ARG\nM=D\n'
+			asm_code += '@SP\nD=M\n@LCL\nM=D\n'
+			asm_code += '@R13\nA=M\n0;JMP\n'
+
+			asm_code += '($RETURN)\n' + self.return_code()
+
+		# Comparison routines expect the return address in D. Each one pops y,
+		# replaces x with true (-1), and sets x to false (0) if x - y fails
+		# the comparison, before returning through R15. The last routine falls
+		# through to the shared return. A call takes about as many
+		# instructions as an inlined comparison, in a quarter of the words.
+		for command, jump in [('eq', 'JEQ'), ('gt', 'JGT'), ('lt', 'JLT')]:
+			asm_code += (f'(${command.upper()})\n@R15\nM=D\n@SP\nAM=M-1\nD=M\n'
+						f'A=A-1\nD=M-D\nM=-1\n@$COMPARE_RETURN\nD;{jump}\n'
+						f'@SP\nA=M-1\nM=0\n')
+			if command != 'lt':
+				asm_code += '@$COMPARE_RETURN\n0;JMP\n'
+		asm_code += '($COMPARE_RETURN)\n@R15\nA=M\n0;JMP\n'
+
+		self.output_file.write(asm_code)
+		self.routines_written = True
+
 	def write_arithmetic(self, command):
 		"""
 		Writes assembly code to translate a given C_ARITHMETIC VM command.
@@ -122,19 +245,22 @@ class CodeWriter():
 			'or': 'D|M'
 		}
 
-		type_2_binary = {
-			'eq': 'JEQ',
-			'gt': 'JGT',
-			'lt': 'JLT'
-		}
-
 		unary = {
 			'neg': '-M',
 			'not': '!M'
 		}
 
+		# inc and dec are written by optimiser.py for push constant 1 followed
+		# by add or sub
+		increments = {
+			'inc': 'M+1',
+			'dec': 'M-1'
+		}
+
 		if command in unary:
 			asm_code = f'@SP\nM=M-1\nA=M\nM={unary[command]}\n@SP\nM=M+1\n'
+		elif command in increments:
+			asm_code = f'@SP\nA=M-1\nM={increments[command]}\n'
 		else:
 			# type_1 and type_2 binary commands have the same first half
 			asm_code = '@SP\nM=M-1\nA=M\nD=M\n@SP\nM=M-1\nA=M\n'
@@ -143,16 +269,11 @@ class CodeWriter():
 			if command in type_1_binary:
 				asm_code += f'D={type_1_binary[command]}\nM=D\n@SP\nM=M+1\n'
 			else:
-				# create labels for jump commands with unique identifier
-				identifier = uuid.uuid4().hex[:4]
-				true_label = (command + '_true_' + identifier)
-				return_label = (command + '_return_' + identifier)
-
-				# append asm_code
-				asm_code += (f'D=M-D\n@{true_label}\nD;{type_2_binary[command]}'
-							f'\n@SP\nA=M\nM=0\n@{return_label}\n0;JMP\n'
-							f'({true_label})\n@SP\nA=M\nM=-1\n@{return_label}'
-							f'\n0;JMP\n({return_label})\n@SP\nM=M+1\n')
+				# Jump to the global comparison routine with the return address
+				# in D (see write_routines).
+				return_label = command + '_return_' + self.get_id()
+				asm_code = (f'@{return_label}\nD=A\n@${command.upper()}\n0;JMP\n'
+							f'({return_label})\n')
 
 		self.output_file.write(asm_code)
 
@@ -174,7 +295,7 @@ class CodeWriter():
 
 		if command == 'C_PUSH':
 			if segment == 'constant':
-				asm_code = f'@{index}\nD=A\n'
+				asm_code = self.constant_code(index)
 
 			elif segment in map_1:
 				asm_code = f'@{index}\nD=A\n@{map_1[segment]}\nA=D+M\nD=M\n' 
@@ -205,6 +326,89 @@ class CodeWriter():
 
 		self.output_file.write(asm_code)
 
+	# Base address registers of the segments that write_push_pop() and
+	# write_move() address directly
+	pointers = {'local': 'LCL', 'argument': 'ARG', 'this': 'THIS', 'that': 'THAT'}
+	registers = {'pointer': 3, 'temp': 5}
+
+	def constant_code(self, value):
+		"""
+		Returns assembly code that sets D to a constant. Constants folded by
+		optimiser.py can be any 16-bit value (e.g., 65535 for -1), whereas
+		A-instructions only load 0 to 32767, so larger values are loaded as
+		the complement of a smaller one.
+		"""
+		if value > 32767:
+			return f'@{~value & 0xFFFF}\nD=!A\n'
+		return f'@{value}\nD=A\n'
+
+	def load_code(self, segment, index):
+		"""
+		Returns assembly code that sets D to the value at index of segment
+		(or to index, if segment is constant), without using the stack.
+		"""
+		if segment == 'constant':
+			return self.constant_code(index)
+		elif segment in self.pointers:
+			if index < 2:
+				return f'@{self.pointers[segment]}\nA=M{"+1" * index}\nD=M\n'
+			return f'@{index}\nD=A\n@{self.pointers[segment]}\nA=D+M\nD=M\n'
+		elif segment in self.registers:
+			return f'@R{self.registers[segment] + index}\nD=M\n'
+		return f'@{self.filename}.{index}\nD=M\n'
+
+	def address_code(self, segment, index):
+		"""
+		Returns assembly code that sets A to the address of index of segment
+		without changing D, or None if the address has to be computed in D
+		(i.e., beyond index 6 of local, argument, this, and that).
+		"""
+		if segment in self.pointers:
+			if index > 6:
+				return None
+			return f'@{self.pointers[segment]}\nA=M\n' + 'A=A+1\n' * index
+		elif segment in self.registers:
+			return f'@R{self.registers[segment] + index}\n'
+		return f'@{self.filename}.{index}\n'
+
+	def write_move(self, source, destination):
+		"""
+		Writes assembly code that effects a C_MOVE command, i.e., push source
+		immediately followed by pop destination, where both are (segment,
+		index) pairs. The value is copied through D without touching the stack.
+		"""
+		segment, index = source
+		if segment == 'constant' and index in [0, 1, 0xFFFF]:
+			value = {0: '0', 1: '1', 0xFFFF: '-1'}[index]
+			asm_code = ''
+		else:
+			value, asm_code = 'D', self.load_code(segment, index)
+
+		address = self.address_code(*destination)
+		if address is None:
+			# Compute the address in R13 first, as D holds the value
+			segment, index = destination
+			asm_code = (f'@{index}\nD=A\n@{self.pointers[segment]}\nD=D+M\n@R13\n'
+						f'M=D\n{asm_code}@R13\nA=M\nM={value}\n')
+		else:
+			asm_code += f'{address}M={value}\n'
+
+		self.output_file.write(asm_code)
+
+	def write_compare_branch(self, command, label, negate=False):
+		"""
+		Writes assembly code that effects eq, gt, or lt immediately followed
+		by if-goto label (i.e., a jump if the comparison holds, or if it fails
+		when negate is true). The boolean result is never pushed to the stack.
+		"""
+		jumps = {'eq': 'JEQ', 'gt': 'JGT', 'lt': 'JLT'}
+		negated = {'eq': 'JNE', 'gt': 'JLE', 'lt': 'JGE'}
+		jump = negated[command] if negate else jumps[command]
+
+		# Pop y then x, and jump on the sign of x - y
+		self.output_file.write(f'@SP\nAM=M-1\nD=M\n@SP\nAM=M-1\nD=M-D\n'
+							f'@{self.filename}.{label}\nD;{jump}\n')
+
 	def write_label(self, label):
 		"""
 		Writes assembly code that effects the label command (i.e., writes
@@ -231,9 +435,21 @@ class CodeWriter():
 		Writes assembly code that effects the call command.
 		"""
 		# Generate unique label for the return address.
-		identifier = uuid.uuid4().hex[:4]
+		identifier = self.get_id()
 		return_label = (f'{function_name}$ret.{identifier}')
 
+		if self.compact:
+			# Pass the called function and num_args in R13 and R14, and the
+			# return address in D, to the global call routine.
+			asm_code = f'@{function_name}\nD=A\n@R13\nM=D\n'
+			if int(num_args) in [0, 1]:
+				asm_code += f'@R14\nM={num_args}\n'
+			else:
+				asm_code += f'@{num_args}\nD=A\n@R14\nM=D\n'
+			asm_code += f'@{return_label}\nD=A\n@$CALL\n0;JMP\n({return_label})\n'
+			self.output_file.write(asm_code)
+			return
+
 		# Create a list to hold all of the .asm symbols that will be pushed 
 		# to the stack to save the state of the calling function.
 		saved_state = ['LCL', 'ARG', 'THIS', 'THAT']
@@ -278,7 +494,16 @@ class CodeWriter():
 
 	def write_return(self):
 		"""
-		Writes assembly code that effects the function command.
+		Writes assembly code that effects the return command.
+		"""
+		if self.compact:
+			self.output_file.write('@$RETURN\n0;JMP\n')
+		else:
+			self.output_file.write(self.return_code())
+
+	def return_code(self):
+		"""
+		Returns the assembly code that effects the return command.
 		"""
 		# FRAME = LCL, where FRAME points to the end of the saved state of
 		# the calling function. Use R13 to store FRAME temp. var.
@@ -306,8 +531,187 @@ class CodeWriter():
 		# Go to return address in the caller's code with unconditional jump.
 		asm_code += '@R14\nA=M\n0;JMP\n'
 
+		return asm_code
+
+
+class VirtualStackWriter(CodeWriter):
+	"""
+	A CodeWriter that keeps the stack pointer in a register for as long as
+	it can. Within a basic block, the depth of the stack is known when the
+	code is written, so pushes and pops only change a virtual offset from the
+	value of SP at the start of the block, stack slots are addressed relative
+	to SP, and the top of the stack is kept in D rather than written to
+	memory. SP is brought up to date (flushed) at labels, jumps, calls,
+	returns, and comparisons, and whenever the offset exceeds max_offset.
+	"""
+
+	max_offset = 4
+
+	def __init__(self, output_file, compact=False):
+		"""
+		Creates a CodeWriter whose virtual stack starts out flushed.
+		"""
+		super().__init__(output_file, compact)
+		self.offset = 0 		# virtual SP - RAM[SP]
+		self.cached = False 	# whether the top of the stack is only in D
+
+	def slot_code(self, k):
+		"""
+		Returns assembly code that sets A to the address RAM[SP] + k.
+		"""
+		if k == 0:
+			return '@SP\nA=M\n'
+		step = '+' if k > 0 else '-'
+		return f'@SP\nA=M{step}1\n' + f'A=A{step}1\n' * (abs(k) - 1)
+
+	def spill_code(self):
+		"""
+		Returns assembly code that writes the top of the stack from D to
+		memory, if it is only in D.
+		"""
+		if not self.cached:
+			return ''
+		self.cached = False
+		return self.slot_code(self.offset - 1) + 'M=D\n'
+
+	def commit_code(self):
+		"""
+		Returns assembly code that adds the virtual offset to SP, without
+		changing D.
+		"""
+		if self.offset == 0:
+			return ''
+		step = 'M=M+1\n' if self.offset > 0 else 'M=M-1\n'
+		asm_code = '@SP\n' + step * abs(self.offset)
+		self.offset = 0
+		return asm_code
+
+	def flush(self):
+		"""
+		Writes the top of the stack to memory and brings SP up to date, so
+		that the stack is where the Standard VM Mapping expects it.
+		"""
+		self.output_file.write(self.spill_code() + self.commit_code())
+
+	def top_code(self):
+		"""
+		Returns assembly code that pops the top of the stack into D.
+		"""
+		asm_code = '' if self.cached else self.slot_code(self.offset - 1) + 'D=M\n'
+		self.offset -= 1
+		self.cached = False
+		return asm_code
+
+	def close(self):
+		self.flush()
+		super().close()
+
+	def set_filename(self, new_input_file):
+		self.flush()
+		super().set_filename(new_input_file)
+
+	def write_push_pop(self, command, segment, index):
+		"""
+		Writes assembly code that pushes into D, or pops from the virtual
+		stack.
+		"""
+		if command == 'C_PUSH':
+			asm_code = self.spill_code() + self.load_code(segment, index)
+			self.offset += 1
+			self.cached = True
+		else:
+			address = self.address_code(segment, index)
+			if address is None:
+				# Compute the address in R13 first, which needs D
+				asm_code = (self.spill_code() + f'@{index}\nD=A\n'
+							f'@{self.pointers[segment]}\nD=D+M\n@R13\nM=D\n'
+							+ self.top_code() + '@R13\nA=M\nM=D\n')
+			else:
+				asm_code = self.top_code() + f'{address}M=D\n'
+
+		self.output_file.write(asm_code)
+		if abs(self.offset) > self.max_offset:
+			self.flush()
+
+	def write_arithmetic(self, command):
+		"""
+		Writes assembly code for arithmetic on the virtual stack, with the
+		result in D. Comparisons flush the stack and are written as usual.
+		"""
+		binary = {'add': 'D+M', 'sub': 'M-D', 'and': 'D&M', 'or': 'D|M'}
+		unary = {'neg': '-', 'not': '!', 'inc': '+1', 'dec': '-1'}
+
+		if command in binary:
+			# y is in D or at the top, and x just below it
+			if self.cached:
+				asm_code = self.slot_code(self.offset - 2)
+			else:
+				asm_code = self.slot_code(self.offset - 1) + 'D=M\nA=A-1\n'
+			asm_code += f'D={binary[command]}\n'
+			self.offset -= 1
+			self.cached = True
+		elif command in unary:
+			op = unary[command]
+			if self.cached:
+				asm_code = f'D={op}D\n' if op in '-!' else f'D=D{op}\n'
+			else:
+				asm_code = self.slot_code(self.offset - 1)
+				asm_code += f'M={op}M\n' if op in '-!' else f'M=M{op}\n'
+		else:
+			self.flush()
+			super().write_arithmetic(command)
+			return
+
+		self.output_file.write(asm_code)
+
+	def write_compare_branch(self, command, label, negate=False):
+		"""
+		Writes assembly code that jumps on the sign of x - y, popped from the
+		virtual stack, after bringing SP up to date.
+		"""
+		jumps = {'eq': 'JEQ', 'gt': 'JGT', 'lt': 'JLT'}
+		negated = {'eq': 'JNE', 'gt': 'JLE', 'lt': 'JGE'}
+		jump = negated[command] if negate else jumps[command]
+
+		if self.cached:
+			asm_code = self.slot_code(self.offset - 2)
+		else:
+			asm_code = self.slot_code(self.offset - 1) + 'D=M\nA=A-1\n'
+		asm_code += 'D=M-D\n'
+		self.offset -= 2
+		self.cached = False
+		asm_code += self.commit_code() + f'@{self.filename}.{label}\nD;{jump}\n'
 		self.output_file.write(asm_code)
 
+	def write_if(self, label):
+		asm_code = self.top_code() + self.commit_code()
+		self.output_file.write(asm_code + f'@{self.filename}.{label}\nD;JNE\n')
+
+	def write_move(self, source, destination):
+		# Moves use D, but not the stack
+		self.output_file.write(self.spill_code())
+		super().write_move(source, destination)
+
+	def write_label(self, label):
+		self.flush()
+		super().write_label(label)
+
+	def write_goto(self, label):
+		self.flush()
+		super().write_goto(label)
+
+	def write_call(self, function_name, num_args):
+		self.flush()
+		super().write_call(function_name, num_args)
+
+	def write_function(self, function_name, num_locals):
+		self.flush()
+		super().write_function(function_name, num_locals)
+
+	def write_return(self):
+		self.flush()
+		super().write_return()
+
 
 class Initialiser():
 	"""
@@ -322,29 +726,63 @@ class Initialiser():
 		generates the file name of the .asm file to be written. Class takes
 		the command line argument (cli) as its argument. 
 		"""
-		if '.vm' in cli:
+		if cli.endswith('.vm'):
 			ls = [cli]
-			asm_filename = cli.replace('vm', 'asm')
+			asm_filename = os.path.splitext(cli)[0] + '.asm'
 		else:
-			ls = [cli + '/' + x for x in os.listdir(cli) if '.vm' in x]
-			asm_filename = cli + '/' + cli.split('/')[1] + '.asm'
+			# Sorted, so that the files are translated in the same order
+			# on every run
+			ls = [cli + '/' + x for x in sorted(os.listdir(cli)) if x.endswith('.vm')]
+			name = os.path.basename(os.path.normpath(cli))
+			asm_filename = cli + '/' + name + '.asm'
 
 		self.vm_files = ls
 		self.asm_filename = asm_filename
 
+	def compare_branch(self, parser):
+		"""
+		If the current command is eq, gt, or lt, immediately followed by an
+		if-goto (optionally with a not in between), returns the comparison, 
+		the label, whether the condition is negated, and the number of 
+		commands involved. Otherwise, returns None.
+		"""
+		command = parser.arg1()
+		if command not in ['eq', 'gt', 'lt']:
+			return None
+
+		following = parser.peek(1)
+		negate = (following is not None
+			and following.type == CommandType.ARITHMETIC
+			and following.arg1 == 'not')
+		if negate:
+			following = parser.peek(2)
+		if following is None or following.type != CommandType.IF:
+			return None
+
+		return command, following.arg1, negate, 3 if negate else 2
+
 	def translate_file(self, parser, code_writer):
 		"""
 		Runs the translation code for a given parser.
 		"""
 		command = parser.command_type()
 
-		# Stack arithmetic commands
+		# Stack arithmetic commands, where comparisons that only feed an 
+		# if-goto are compiled into a single conditional jump
 		if command == 'C_ARITHMETIC':
-			code_writer.write_arithmetic(parser.arg1())
+			branch = self.compare_branch(parser)
+			if branch:
+				code_writer.write_compare_branch(*branch[:3])
+				for i in range(branch[3] - 1):
+					parser.advance()
+			else:
+				code_writer.write_arithmetic(parser.arg1())
 
 		# Memory access commands
 		elif command == 'C_PUSH' or command == 'C_POP':
 			code_writer.write_push_pop(command, parser.arg1(), parser.arg2())
+		elif command == 'C_MOVE':
+			code_writer.write_move(parser.arg1(), parser.arg2())
 
 		# Program flow commands
 		elif command == 'C_LABEL':
@@ -0,0 +1,333 @@
+"""
+Runs a VM program directly, without translating it to Hack assembly: the
+parsed commands of every file (see utils.Parser) are decoded once into a list
+of small functions, one per command, with labels and functions resolved to
+indices into the list, and segment accesses resolved to RAM addresses or base
+registers. The dispatch loop then only calls the function at the program
+counter. RAM is laid out as by CodeWriter (SP, LCL, ARG, THIS, THAT, temp,
+and statics from address 16), so the result of a program can be compared
+with that of its translation, run on an emulator (except for return addresses,
+which are command indices rather than ROM addresses, and R13-R15 and the words
+above the stack, which translated code uses as scratch space). Usage:
+python vm_interpreter.py Prog.vm|ProgDir [--steps N] [--ram FIRST LAST] [--optimise]
+"""
+
+import sys
+import time
+from array import array 	# RAM of 16-bit words
+from utils import Parser, CodeWriter, Initialiser, Command, CommandType
+import optimiser
+
+RAM_SIZE = 32768
+STACK_BASE = 256 	# where the bootstrap code starts the stack
+STATIC_BASE = 16 	# the first address that the assembler gives variables
+
+# RAM addresses of the registers of the VM, and the base address registers of
+# the segments addressed through them (as in CodeWriter.pointers)
+symbols = ['SP', 'LCL', 'ARG', 'THIS', 'THAT']
+bases = {segment: symbols.index(symbol) for segment, symbol in CodeWriter.pointers.items()}
+
+# The 16-bit result of each arithmetic command, as a function of x (the
+# second value from the top of the stack) and y (the top). Comparisons are
+# made on the sign of the 16-bit difference x - y, as in translated code, and
+# true is -1.
+binary = {
+	'add': lambda x, y: (x + y) & 0xFFFF,
+	'sub': lambda x, y: (x - y) & 0xFFFF,
+	'and': lambda x, y: x & y,
+	'or': lambda x, y: x | y,
+	'eq': lambda x, y: 0xFFFF if x == y else 0,
+	'gt': lambda x, y: 0xFFFF if 0 < (x - y) & 0xFFFF < 0x8000 else 0,
+	'lt': lambda x, y: 0xFFFF if (x - y) & 0x8000 else 0,
+}
+unary = {
+	'neg': lambda y: -y & 0xFFFF,
+	'not': lambda y: ~y & 0xFFFF,
+	'inc': lambda y: (y + 1) & 0xFFFF,
+	'dec': lambda y: (y - 1) & 0xFFFF,
+}
+
+class VMError(Exception):
+	"""
+	Raised when a VM program can't be loaded (e.g., because it uses a label
+	that isn't defined) or does something the VM can't do at run time.
+	"""
+
+class Interpreter():
+	"""
+	A VM program loaded from a list of Parsers, one for each file. The state
+	of the VM is available as attributes: the RAM (.ram, an array of 16-bit
+	words), the index of the next command (.pc), and whether it has halted.
+	"""
+
+	def __init__(self, parsers):
+		"""
+		Decodes the commands of every file, and resets the VM. If there is a
+		Sys.init function, the program starts with the bootstrap code (SP =
+		256, call Sys.init 0), otherwise at the first command of the first
+		file, with SP = 256.
+		"""
+		self.ram = array('H', bytes(2 * RAM_SIZE))
+		self.commands = [
+			(parser.filename, command) for parser in parsers for command in parser.commands
+		]
+		self.labels = {}
+		self.functions = {}
+		for i, (filename, command) in enumerate(self.commands):
+			# Labels are named after the file, as in the translated code
+			if command.type == CommandType.LABEL:
+				self.labels[filename, command.arg1] = i
+			elif command.type == CommandType.FUNCTION:
+				self.functions[command.arg1] = i
+
+		self.start = 0
+		if 'Sys.init' in self.functions:
+			self.start = len(self.commands)
+			self.commands.append(('$init', Command(CommandType.CALL, 'Sys.init', 0)))
+		# Return addresses are command indices, so they must fit in a word
+		if len(self.commands) > 0xFFFF:
+			raise VMError(f"the program has more than {0xFFFF} commands.")
+
+		self.statics = {}
+		self.ops = [self.decode(i, *entry) for i, entry in enumerate(self.commands)]
+		# Running off the end of the program halts it
+		end = len(self.commands)
+		self.ops.append(lambda: ~end)
+		self.reset()
+
+	def reset(self):
+		"""
+		Clears the RAM and starts the program again.
+		"""
+		self.ram[:] = array('H', bytes(2 * RAM_SIZE))
+		self.ram[0] = STACK_BASE
+		self.pc = self.start
+		self.halted = False
+
+	def static(self, filename, index):
+		"""
+		Returns the RAM address of a static variable. Statics are given
+		addresses from STATIC_BASE in the order they first appear in the
+		program, as the assembler gives addresses to variables.
+		"""
+		if (filename, index) not in self.statics:
+			self.statics[filename, index] = STATIC_BASE + len(self.statics)
+		return self.statics[filename, index]
+
+	def address(self, filename, segment, index):
+		"""
+		Returns the RAM address of index of a segment whose address is fixed
+		(temp, pointer, or static), or None for a segment addressed through a
+		base register.
+		"""
+		if segment in CodeWriter.registers:
+			return CodeWriter.registers[segment] + index
+		elif segment == 'static':
+			return self.static(filename, index)
+		return None
+
+	def target(self, filename, label):
+		"""
+		Returns the index of the command after a label of a file.
+		"""
+		if (filename, label) not in self.labels:
+			raise VMError(f"label {label} is not defined in {filename}.vm.")
+		return self.labels[filename, label] + 1
+
+	def decode(self, i, filename, command):
+		"""
+		Returns a function that executes the command at index i of the
+		program, of the named file, and returns the index of the next command
+		(or ~i, if the command halts the VM).
+		"""
+		ram = self.ram
+		following = i + 1
+		kind, arg1, arg2 = command
+
+		if kind == CommandType.ARITHMETIC:
+			if arg1 in unary:
+				f = unary[arg1]
+				def op():
+					sp = ram[0] - 1
+					ram[sp] = f(ram[sp])
+					return following
+			else:
+				f = binary[arg1]
+				def op():
+					sp = ram[0] - 1
+					ram[0] = sp
+					ram[sp - 1] = f(ram[sp - 1], ram[sp])
+					return following
+			return op
+
+		elif kind == CommandType.PUSH or kind == CommandType.MOVE:
+			if kind == CommandType.PUSH:
+				load = self.load(filename, arg1, arg2)
+				def op():
+					sp = ram[0]
+					ram[sp] = load()
+					ram[0] = sp + 1
+					return following
+				return op
+			load = self.load(filename, *arg1)
+			store = self.store(filename, *arg2)
+			def op():
+				store(load())
+				return following
+			return op
+
+		elif kind == CommandType.POP:
+			store = self.store(filename, arg1, arg2)
+			def op():
+				sp = ram[0] - 1
+				ram[0] = sp
+				store(ram[sp])
+				return following
+			return op
+
+		elif kind == CommandType.LABEL or kind == CommandType.FUNCTION and not arg2:
+			return lambda: following
+
+		elif kind == CommandType.GOTO:
+			target = self.target(filename, arg1)
+			if target == i:
+				# label X, goto X: the infinite loop that programs end with
+				return lambda: ~i
+			return lambda: target
+
+		elif kind == CommandType.IF:
+			target = self.target(filename, arg1)
+			def op():
+				sp = ram[0] - 1
+				ram[0] = sp
+				return target if ram[sp] else following
+			return op
+
+		elif kind == CommandType.FUNCTION:
+			zeros = array('H', bytes(2 * arg2))
+			def op():
+				sp = ram[0]
+				ram[sp:sp + arg2] = zeros
+				ram[0] = sp + arg2
+				return following
+			return op
+
+		elif kind == CommandType.CALL:
+			if arg1 not in self.functions:
+				raise VMError(f"function {arg1} is not defined.")
+			entry = self.functions[arg1]
+			def op():
+				sp = ram[0]
+				# Return address, LCL, ARG, THIS, and THAT
+				ram[sp] = following
+				ram[sp + 1:sp + 5] = ram[1:5]
+				ram[2] = sp - arg2
+				ram[0] = ram[1] = sp + 5
+				return entry
+			return op
+
+		elif kind == CommandType.RETURN:
+			def op():
+				frame = ram[1]
+				returned = ram[frame - 5]
+				arg = ram[2]
+				ram[arg] = ram[ram[0] - 1]
+				ram[0] = arg + 1
+				ram[1:5] = ram[frame - 4:frame]
+				return returned
+			return op
+
+	def load(self, filename, segment, index):
+		"""
+		Returns a function that returns the value at index of segment (or
+		index, if segment is constant).
+		"""
+		ram = self.ram
+		if segment == 'constant':
+			return lambda: index
+		address = self.address(filename, segment, index)
+		if address is not None:
+			return lambda: ram[address]
+		base = bases[segment]
+		return lambda: ram[ram[base] + index]
+
+	def store(self, filename, segment, index):
+		"""
+		Returns a function that writes a value to index of segment.
+		"""
+		ram = self.ram
+		address = self.address(filename, segment, index)
+		if address is not None:
+			def store(value):
+				ram[address] = value
+		else:
+			base = bases[segment]
+			def store(value):
+				ram[ram[base] + index] = value
+		return store
+
+	def run(self, max_steps=10 ** 9):
+		"""
+		Runs the program from the current state until it halts (i.e., runs
+		off the end of the program, or reaches a goto to the label just before
+		it) or max_steps commands have been executed. Returns the number of
+		commands executed. Raises VMError if the program returns to an
+		address that isn't a command, or addresses RAM out of range.
+		"""
+		ops = self.ops
+		pc = self.pc
+
+		steps = 0
+		try:
+			while pc >= 0 and steps < max_steps:
+				pc = ops[pc]()
+				steps += 1
+		except (IndexError, OverflowError):
+			if pc >= len(self.commands):
+				raise VMError(f"returned to {pc}, which is not the index of a command.")
+			filename, command = self.commands[pc]
+			raise VMError(f"a RAM address is out of range at {command} in {filename}.vm.")
+
+		if pc < 0:
+			pc = ~pc
+			self.halted = True
+		self.pc = pc
+		return steps
+
+	def signed(self, address):
+		"""
+		Returns the word at a RAM address as a signed int.
+		"""
+		value = self.ram[address]
+		return value - 0x10000 if value & 0x8000 else value
+
+def load(path, optimise=False):
+	"""
+	Returns an Interpreter with a .vm file, or the .vm files of a directory,
+	loaded. If optimise is true, the commands of every file are optimised
+	first (see optimiser.py).
+	"""
+	parsers = [Parser(vm_file) for vm_file in Initialiser(path).vm_files]
+	if optimise:
+		for parser in parsers:
+			parser.commands = optimiser.optimise(parser.commands)[0]
+	return Interpreter(parsers)
+
+if __name__ == '__main__':
+	options = sys.argv[2:]
+	steps = int(options[options.index('--steps') + 1]) if '--steps' in options else None
+	try:
+		interpreter = load(sys.argv[1], '--optimise' in options)
+		start = time.perf_counter()
+		executed = interpreter.run(steps or 10 ** 9)
+	except VMError as error:
+		sys.exit(f"VMError: {error}")
+	elapsed = time.perf_counter() - start
+	print(f'{executed} VM commands in {elapsed:.3f}s '
+		f'({executed / elapsed / 1e6:.2f} million per second)'
+		+ (', halted' if interpreter.halted else ''))
+	if '--ram' in options:
+		first = int(options[options.index('--ram') + 1])
+		last = int(options[options.index('--ram') + 2])
+		for address in range(first, last + 1):
+			print(f'RAM[{address}] = {interpreter.signed(address)}')
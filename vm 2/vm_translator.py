@@ -1,25 +1,255 @@
+import io
 import sys
-from utils import Parser, CodeWriter, Initialiser
+from concurrent.futures import ProcessPoolExecutor 	# pool for --jobs
+from utils import Parser, CodeWriter, VirtualStackWriter, Initialiser, CommandType
+import cache
+import call_graph
+import inliner
+import optimiser
+
+def translate_commands(commands, filename, compact=False, virtual=False):
+	"""
+	Translates a list of commands of the .vm file named filename (without
+	extension) into a buffer and returns the assembly code as a str. If
+	virtual is true, the code is written by a VirtualStackWriter.
+	"""
+	parser = Parser(filename + '.vm', commands)
+	initialiser = Initialiser(filename + '.vm')
+	writer = VirtualStackWriter if virtual else CodeWriter
+	code_writer = writer(io.StringIO(), compact)
+	# The global routines are written once, after the bootstrap code
+	code_writer.routines_written = True
+
+	code_writer.set_filename(parser.filename)
+	while parser.has_more_commands():
+		initialiser.translate_file(parser, code_writer)
+	if virtual:
+		code_writer.flush()
+
+	return code_writer.output_file.getvalue()
+
+def translate(vm_file, compact=False, virtual=False, optimise=False, live=None, plan=None):
+	"""
+	Translates a single .vm file and returns its assembly code as a str, and
+	a dictionary of the optimiser's hits (empty unless optimise is true). If
+	plan is given, its functions are inlined (see inline_plan), and if live
+	is a set of function names, the file's other functions are left out.
+	Every file is translated independently (statics and generated labels are
+	named after the file), so files can be translated in any order, or in
+	parallel, and concatenated afterwards.
+	"""
+	parser = Parser(vm_file)
+	commands = parser.commands
+	if plan:
+		commands = inliner.inline(commands, plan, parser.filename)[0]
+	if live is not None:
+		commands = call_graph.prune(commands, live)[0]
+	hits = {}
+	if optimise:
+		commands, hits = optimiser.optimise(commands)
+
+	return translate_commands(commands, parser.filename, compact, virtual), hits
+
+def translate_files(
+		vm_files, compact=False, virtual=False, optimise=False, live=None, plan=None,
+		jobs=1
+	):
+	"""
+	Translates a list of .vm files and returns a list of the results of
+	translate(), in the same order. If jobs is greater than 1, the files are
+	translated by that many processes.
+	"""
+	n = len(vm_files)
+	if jobs > 1 and n > 1:
+		with ProcessPoolExecutor(jobs) as pool:
+			return list(pool.map(
+				translate, vm_files, [compact] * n, [virtual] * n, [optimise] * n,
+				[live] * n, [plan] * n
+			))
+
+	return [
+		translate(vm_file, compact, virtual, optimise, live, plan)
+		for vm_file in vm_files
+	]
+
+def count_words(asm_code):
+	"""
+	Returns the number of ROM words that assembly code assembles into.
+	"""
+	return sum(1 for line in asm_code.splitlines() if line[0] != '(')
+
+def inline_plan(parsers, threshold=16, budget=1000, compact=False, optimise=False):
+	"""
+	Chooses the functions of a program to inline (see inliner.py), given a
+	parser for each of its files: functions with at most threshold commands
+	that can be inlined, in order of the growth of the ROM that inlining them
+	everywhere causes, for as long as the total growth stays within budget
+	words. Growth is estimated by translating one copy of each function. 
+	Returns a dictionary of the (file name, commands) of every chosen
+	function, and prints a report of them.
+	"""
+	functions = {}
+	for parser in parsers:
+		for name, commands in call_graph.split_functions(parser.commands).items():
+			if name is not None:
+				functions[name] = (parser.filename, commands)
+	graph = call_graph.build([parser.commands for parser in parsers])
+	candidates = inliner.candidates(functions, graph, threshold)
+
+	# The growth of every call site: the words of a copy less those of a call
+	growth = {name: 0 for name in candidates}
+	sites = {name: 0 for name in candidates}
+	site_growth = {}
+	for parser in parsers:
+		for command in parser.commands:
+			name = command.arg1
+			if command.type != CommandType.CALL or not inliner.can_inline(
+				candidates, name, parser.filename
+			):
+				continue
+			if (name, command.arg2) not in site_growth:
+				copy = inliner.expand(name, candidates[name][1], command.arg2, 0, 0)
+				if optimise:
+					copy = optimiser.optimise(copy)[0]
+				site_growth[name, command.arg2] = (
+					count_words(translate_commands(copy, parser.filename, compact))
+					- count_words(translate_commands([command], parser.filename, compact))
+				)
+			growth[name] += site_growth[name, command.arg2]
+			sites[name] += 1
+
+	plan = {}
+	total = 0
+	for name in sorted(growth, key=lambda name: (growth[name], name)):
+		if sites[name] and total + growth[name] <= budget:
+			plan[name] = candidates[name]
+			total += growth[name]
+
+	print(f'inline: {len(plan)} functions inlined at {sum(sites[n] for n in plan)} '
+		f'call sites (about {total:+} ROM words)')
+	for name in sorted(plan):
+		print(f'  {name}: {sites[name]} sites, {growth[name]:+} words')
+
+	return plan
+
+def prune(parsers, compact=False, optimise=False):
+	"""
+	Finds the functions of a program that can't be reached from Sys.init
+	(see call_graph.py), given a parser for each of its files. Returns the
+	set of live functions, and a list of the sorted names of the dead
+	functions in each file. Prints a report of the dead functions and the
+	ROM words that leaving them out saves.
+	"""
+	graph = call_graph.build([parser.commands for parser in parsers])
+	if 'Sys.init' not in graph:
+		print('--prune is ignored without Sys.init')
+		return None, [[] for _ in parsers]
+	live = call_graph.reachable(graph)
+
+	dead = []
+	saved = 0
+	for parser in parsers:
+		_, removed = call_graph.prune(parser.commands, live)
+		dead.append(sorted(removed))
+
+		# Translate the dead functions on their own to count their words
+		commands = [command for body in removed.values() for command in body]
+		if optimise:
+			commands = optimiser.optimise(commands)[0]
+		saved += count_words(translate_commands(commands, parser.filename, compact))
+
+	print(f'prune: {sum(map(len, dead))} unreachable functions removed '
+		f'({saved} ROM words saved)')
+	for name in sorted(name for names in dead for name in names):
+		print(f'  {name}')
+
+	return live, dead
 
 def main():
-	# Create initialiser instance, and pass it command line argument
+	# Create initialiser instance, and pass it command line argument. Pass
+	# --jobs N to translate the vm_files in N processes, and --cache DIR to
+	# reuse the translations of unchanged files from earlier runs (the cache
+	# is limited to --cache-size MB, 64 by default). Pass --optimise to run
+	# optimiser.py over the commands of every file before translating them,
+	# and --prune to leave out functions that are never called. Pass --inline
+	# to inline functions of up to --inline-size commands (16 by default), as
+	# long as the ROM grows by at most --inline-budget words (1000). Pass
+	# --virtual-stack to keep SP in a register within basic blocks.
 	initialiser = Initialiser(sys.argv[1])
+	options = sys.argv[2:]
+	jobs = int(options[options.index('--jobs') + 1]) if '--jobs' in options else 1
+	cache_dir = options[options.index('--cache') + 1] if '--cache' in options else None
+	optimise = '--optimise' in options
+	virtual = '--virtual-stack' in options
+	inline_size = (
+		int(options[options.index('--inline-size') + 1]) if '--inline-size' in options
+		else 16
+	)
+	inline_budget = (
+		int(options[options.index('--inline-budget') + 1]) if '--inline-budget' in options
+		else 1000
+	)
+	cache_size = (
+		float(options[options.index('--cache-size') + 1]) if '--cache-size' in options
+		else 64
+	)
 
-	# Create code_writer instance and write bootstrap code to file
-	code_writer = CodeWriter(initialiser.asm_filename)
+	# Create code_writer instance and write bootstrap code to file. Pass
+	# --compact to optimise for ROM size rather than speed.
+	code_writer = CodeWriter(initialiser.asm_filename, '--compact' in options)
 	code_writer.write_init()
 
-	# Create list of parsers, one for each vm_file
-	parsers = [Parser(x) for x in initialiser.vm_files]
+	vm_files = initialiser.vm_files
+	live, dead, plan = None, [[] for _ in vm_files], None
+	if '--inline' in options or '--prune' in options:
+		# Both need the whole program. Functions are inlined first, as that
+		# can leave them uncalled.
+		parsers = [Parser(vm_file) for vm_file in vm_files]
+		if '--inline' in options:
+			plan = inline_plan(
+				parsers, inline_size, inline_budget, code_writer.compact, optimise
+			)
+			for parser in parsers:
+				parser.commands = inliner.inline(parser.commands, plan, parser.filename)[0]
+		if '--prune' in options:
+			live, dead = prune(parsers, code_writer.compact, optimise)
 
-	for parser in parsers:
-		# Set filename of parser that is currently being translated
-		code_writer.set_filename(parser.filename)
+	# Look up every vm_file in the cache, and translate the rest
+	translations = [None] * len(vm_files)
+	if cache_dir:
+		modes = [o for o in ['--compact', '--virtual-stack', '--optimise'] if o in options]
+		keys = [
+			cache.key(vm_file, modes, removed, plan)
+			for vm_file, removed in zip(vm_files, dead)
+		]
+		translations = [cache.get(cache_dir, key) for key in keys]
+	missing = [i for i, asm_code in enumerate(translations) if asm_code is None]
+	translated = translate_files(
+		[vm_files[i] for i in missing], code_writer.compact, virtual, optimise, live,
+		plan, jobs
+	)
+	total_hits = {name: 0 for name, _ in optimiser.rewrites}
+	for i, (asm_code, hits) in zip(missing, translated):
+		translations[i] = asm_code
+		for name, count in hits.items():
+			total_hits[name] += count
+		if cache_dir:
+			cache.put(cache_dir, keys[i], asm_code)
+	if cache_dir:
+		cache.evict(cache_dir, int(cache_size * 2 ** 20))
+
+	if optimise:
+		# Files that were found in the cache aren't optimised again
+		print(f'optimiser: {len(missing)} of {len(vm_files)} files optimised')
+		for name, count in total_hits.items():
+			print(f'  {name}: {count}')
 
-		# Parse the VM file
-		while parser.has_more_commands():
-			initialiser.translate_file(parser, code_writer)
+	# Write the translations in the order of vm_files, so output is the same
+	# however the files were translated
+	for asm_code in translations:
+		code_writer.output_file.write(asm_code)
 
 	code_writer.close()
 
-main()
+if __name__ == '__main__':
+	main()
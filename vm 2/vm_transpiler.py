@@ -0,0 +1,493 @@
+"""
+Compiles a VM program into Python, so that long-running programs run at the
+speed of Python code rather than of an interpreter (see vm_interpreter.py).
+Every VM function becomes a Python function of this, that (the caller's
+pointers, which a VM function starts with), and its arguments, and a call is a
+direct Python call. Arguments, locals, pointers, and the stack are Python
+variables rather than RAM:
+- the stack is resolved when the code is written: a push only adds a Python
+  expression to a symbolic stack, which arithmetic combines and a pop, call,
+  or return consumes, so most commands write no code at all. Expressions are
+  spilled to stack variables (s0, s1, ...) at labels and jumps, at calls, and
+  before a write to something they read;
+- control flow within a function is a loop over its basic blocks, where a
+  block runs if the block number b is at most its own, so falling through to
+  the next block costs one comparison, and a jump sets b (and restarts the
+  loop if it jumps backwards).
+The this, that, temp, and static segments are in RAM (a list of 16-bit ints,
+laid out as by CodeWriter), and every value is kept within 0 to 65535. Calls
+nest as deeply as Python frames, so programs run in a thread with a large
+stack and a raised recursion limit. A program ends when it returns from its
+first function, or reaches a loop that does nothing (e.g., label X, goto X).
+Usage:
+python vm_transpiler.py Prog.vm|ProgDir [--ram FIRST LAST] [--source Prog.py]
+"""
+
+import sys
+import threading
+import time
+from utils import Parser, Initialiser, CommandType
+from vm_interpreter import RAM_SIZE, STATIC_BASE, VMError, binary, unary
+import inliner
+
+RECURSION_LIMIT = 200000 	# Python frames, i.e., nested VM calls
+STACK_SIZE = 1024 * 2 ** 20 	# bytes of stack of the thread that runs programs
+MAX_EXPRESSION = 400 	# longest expression kept on the symbolic stack
+
+class Halt(Exception):
+	"""
+	Raised by transpiled code that reaches a loop that does nothing, which is
+	how VM programs end.
+	"""
+
+# Python conditions for comparisons of x and y (on the sign of the 16-bit
+# difference x - y, as in translated code), and expressions for the rest of
+# the arithmetic commands
+conditions = {
+	'eq': '{x} == {y}',
+	'gt': '0 < (({x} - {y}) & 0xFFFF) < 0x8000',
+	'lt': '({x} - {y}) & 0x8000',
+}
+expressions = {
+	'add': '(({x} + {y}) & 0xFFFF)',
+	'sub': '(({x} - {y}) & 0xFFFF)',
+	'and': '({x} & {y})',
+	'or': '({x} | {y})',
+	'neg': '(-{y} & 0xFFFF)',
+	'not': '(~{y} & 0xFFFF)',
+	'inc': '(({y} + 1) & 0xFFFF)',
+	'dec': '(({y} - 1) & 0xFFFF)',
+}
+
+class Entry():
+	"""
+	A value on the symbolic stack: a Python expression, the set of names it
+	reads ('ram' for RAM), and a Python condition that is true when the value
+	is not 0, if there is one simpler than the expression.
+	"""
+
+	def __init__(self, expression, reads, condition=None):
+		self.expression = expression
+		self.reads = reads
+		self.condition = condition
+
+	def is_constant(self):
+		"""
+		Returns true if the value is known, i.e., the expression is an int.
+		"""
+		return self.expression.isdigit()
+
+class FunctionWriter():
+	"""
+	Writes the Python source of a single VM function, given the commands of
+	its body (after the function command).
+	"""
+
+	def __init__(self, program, filename, name, number, num_locals, body):
+		self.program = program
+		self.filename = filename
+		self.name = name
+		self.body = body
+		self.stack = []
+		self.lines = []
+		self.effects = 0 	# statements written so far, other than block headers
+		self.depths = self.label_depths()
+
+		# Blocks start at labels (other than a label that follows another) and
+		# after jumps and returns
+		self.blocks = {}
+		self.starts = set()
+		block = 0
+		for i, command in enumerate(body):
+			if i > 0 and (
+				command.type == CommandType.LABEL and body[i - 1].type != CommandType.LABEL
+				or body[i - 1].type in [CommandType.GOTO, CommandType.IF, CommandType.RETURN]
+			):
+				block += 1
+				self.starts.add(i)
+			if command.type == CommandType.LABEL:
+				self.blocks[command.arg1] = block
+		self.looped = block > 0 or bool(self.blocks)
+
+		indices = {
+			c.arg2 for c in body
+			if c.type in [CommandType.PUSH, CommandType.POP] and c.arg1 == 'local'
+		}
+		self.num_locals = max([num_locals] + [i + 1 for i in indices])
+		self.header = f'def f{number}(this, that{program.parameters(name)}):'
+
+	def label_depths(self):
+		"""
+		Returns a dictionary of the depth of the function's stack at each of
+		its labels that can be reached, which must be the same on every path.
+		"""
+		labels = {c.arg1: i for i, c in enumerate(self.body) if c.type == CommandType.LABEL}
+		depth = {0: 0}
+		work = [0]
+		while work:
+			i = work.pop()
+			if i >= len(self.body) or self.body[i].type == CommandType.RETURN:
+				continue
+			command = self.body[i]
+			d = depth[i] + inliner.stack_effect(command)
+			if command.type == CommandType.GOTO:
+				targets = [labels.get(command.arg1)]
+			elif command.type == CommandType.IF:
+				targets = [labels.get(command.arg1), i + 1]
+			else:
+				targets = [i + 1]
+			for target in targets:
+				if target is None:
+					raise VMError(f"label {command.arg1} is not defined in {self.name}.")
+				if target not in depth:
+					depth[target] = d
+					work.append(target)
+				elif depth[target] != d:
+					label = self.body[target].arg1
+					raise VMError(
+						f"{self.name} reaches label {label} with different "
+						"stack depths."
+					)
+
+		return {
+			c.arg1: depth[i] for i, c in enumerate(self.body)
+			if c.type == CommandType.LABEL and i in depth
+		}
+
+	def write(self, line, effect=True):
+		"""
+		Writes a line of the function's body, indented in its block.
+		"""
+		self.lines.append(('\t\t\t' if self.looped else '\t') + line)
+		self.effects += effect
+
+	def push(self, entry):
+		"""
+		Pushes an entry onto the symbolic stack, spilling it if its expression
+		is getting too long.
+		"""
+		self.stack.append(entry)
+		if len(entry.expression) > MAX_EXPRESSION:
+			self.spill()
+
+	def spill(self):
+		"""
+		Writes the code that assigns every expression on the symbolic stack to
+		the stack variable of its depth, so that the stack only holds stack
+		variables, which read nothing but themselves.
+		"""
+		names, values = [], []
+		for i, entry in enumerate(self.stack):
+			if entry.expression != f's{i}':
+				names.append(f's{i}')
+				values.append(entry.expression)
+				self.stack[i] = Entry(f's{i}', {f's{i}'})
+		if names:
+			self.write(f'{", ".join(names)} = {", ".join(values)}')
+
+	def assign(self, target, value, writes):
+		"""
+		Writes the code that assigns value (an Entry) to target, where writes
+		is the name that the assignment changes ('ram' for RAM), spilling the
+		stack first if anything on it reads that name.
+		"""
+		if any(writes in entry.reads for entry in self.stack):
+			self.spill()
+		self.write(f'{target} = {value.expression}')
+
+	def location(self, segment, index):
+		"""
+		Returns the Python expression for index of segment (other than
+		constant), and the name that it reads and writes.
+		"""
+		if segment == 'local':
+			return f'l{index}', f'l{index}'
+		elif segment == 'argument':
+			return f'a{index}', f'a{index}'
+		elif segment == 'pointer':
+			return ['this', 'that'][index], ['this', 'that'][index]
+		elif segment in ['this', 'that']:
+			return f'ram[{segment} + {index}]' if index else f'ram[{segment}]', 'ram'
+		elif segment == 'temp':
+			return f'ram[{5 + index}]', 'ram'
+		return f'ram[{self.program.static(self.filename, index)}]', 'ram'
+
+	def load(self, segment, index):
+		"""
+		Returns an Entry for the value at index of segment.
+		"""
+		if segment == 'constant':
+			return Entry(str(index & 0xFFFF), set())
+		expression, name = self.location(segment, index)
+		reads = {name, segment} if segment in ['this', 'that'] else {name}
+		return Entry(expression, reads)
+
+	def store(self, segment, index, value):
+		"""
+		Writes the code that stores an Entry at index of segment.
+		"""
+		target, name = self.location(segment, index)
+		self.assign(target, value, name)
+
+	def arithmetic(self, command):
+		"""
+		Applies an arithmetic command to the symbolic stack, folding it if its
+		operands are constants.
+		"""
+		y = self.stack.pop()
+		if command in unary:
+			if y.is_constant():
+				self.push(Entry(str(unary[command](int(y.expression))), set()))
+			elif command == 'not' and y.condition:
+				condition = f'not ({y.condition})'
+				self.push(Entry(f'(0 if {y.condition} else 0xFFFF)', y.reads, condition))
+			else:
+				self.push(Entry(expressions[command].format(y=y.expression), y.reads))
+			return
+
+		x = self.stack.pop()
+		reads = x.reads | y.reads
+		if x.is_constant() and y.is_constant():
+			value = binary[command](int(x.expression), int(y.expression))
+			self.push(Entry(str(value), set()))
+		elif command in conditions:
+			condition = conditions[command].format(x=x.expression, y=y.expression)
+			self.push(Entry(f'(0xFFFF if {condition} else 0)', reads, condition))
+		else:
+			expression = expressions[command].format(x=x.expression, y=y.expression)
+			self.push(Entry(expression, reads))
+
+	def jump(self, label, condition=None):
+		"""
+		Writes the code that jumps to a label (if condition holds), after
+		spilling the stack. A jump back to a label, with nothing written
+		since, is a loop that does nothing, and halts the program.
+		"""
+		if label not in self.blocks:
+			raise VMError(f"label {label} is not defined in {self.name}.")
+		self.spill()
+		target = self.blocks[label]
+		indent = ''
+		if condition:
+			self.write(f'if {condition}:')
+			indent = '\t'
+		if target <= self.block and self.effects == self.marks[target]:
+			self.write(indent + 'raise Halt')
+		elif target <= self.block:
+			self.write(f'{indent}b = {target}')
+			self.write(f'{indent}continue')
+		else:
+			self.write(f'{indent}b = {target}')
+
+	def start_block(self, i):
+		"""
+		Spills the stack and starts a new block at command i.
+		"""
+		self.spill()
+		if len(self.lines) == self.opened:
+			self.write('pass', False)
+		self.block += 1
+		self.marks[self.block] = self.effects
+		command = self.body[i]
+		if command.type == CommandType.LABEL and command.arg1 in self.depths:
+			depth = self.depths[command.arg1]
+			self.stack = [Entry(f's{k}', {f's{k}'}) for k in range(depth)]
+		self.lines.append(f'\t\tif b <= {self.block}:')
+		self.opened = len(self.lines)
+
+	def source(self):
+		"""
+		Returns the Python source of the function.
+		"""
+		self.block = 0
+		self.marks = {0: 0}
+		if self.looped:
+			self.lines.append('\tb = 0')
+			self.lines.append('\twhile True:')
+			self.lines.append('\t\tif b <= 0:')
+		self.opened = len(self.lines)
+
+		for i, command in enumerate(self.body):
+			if i in self.starts:
+				self.start_block(i)
+			kind, arg1, arg2 = command
+
+			if kind == CommandType.PUSH:
+				self.push(self.load(arg1, arg2))
+			elif kind == CommandType.POP:
+				self.store(arg1, arg2, self.stack.pop())
+			elif kind == CommandType.MOVE:
+				self.store(*arg2, self.load(*arg1))
+			elif kind == CommandType.ARITHMETIC:
+				self.arithmetic(arg1)
+			elif kind == CommandType.GOTO:
+				self.jump(arg1)
+			elif kind == CommandType.IF:
+				value = self.stack.pop()
+				if not value.is_constant():
+					self.jump(arg1, value.condition or value.expression)
+				elif int(value.expression):
+					self.jump(arg1)
+			elif kind == CommandType.CALL:
+				args = [self.stack.pop() for _ in range(arg2)][::-1]
+				self.spill()
+				call = self.program.call(arg1, [arg.expression for arg in args])
+				name = f's{len(self.stack)}'
+				self.write(f'{name} = {call}')
+				self.stack.append(Entry(name, {name}))
+			elif kind == CommandType.RETURN:
+				self.write(f'return {self.stack[-1].expression if self.stack else 0}')
+				self.stack = []
+			elif kind == CommandType.FUNCTION:
+				raise VMError(f"function {arg1} is declared inside {self.name}.")
+
+		self.spill()
+		self.write(f'raise VMError("{self.name} ran past its end.")')
+		lines = [self.header, f'\t# {self.name}']
+		if self.num_locals:
+			lines.append('\t' + ' = '.join(f'l{i}' for i in range(self.num_locals)) + ' = 0')
+		return '\n'.join(lines + self.lines) + '\n'
+
+class Program():
+	"""
+	A VM program compiled into Python from a list of Parsers, one for each
+	file. Its RAM (.ram, a list of 16-bit ints) is shared by every run, and
+	run() tells whether the program halted.
+	"""
+
+	def __init__(self, parsers):
+		"""
+		Writes the Python source of every function of the program (available
+		as .source), and compiles it.
+		"""
+		self.ram = [0] * RAM_SIZE
+		self.statics = {}
+		functions = []
+		for parser in parsers:
+			name = None
+			for command in parser.commands:
+				if command.type == CommandType.FUNCTION:
+					name = command.arg1
+					functions.append((parser.filename, name, command.arg2, []))
+				elif name is None:
+					raise VMError(f"{parser.filename}.vm has commands outside functions.")
+				else:
+					functions[-1][3].append(command)
+		self.numbers = {name: i for i, (_, name, _, _) in enumerate(functions)}
+
+		# A function takes as many arguments as it is ever called with, or
+		# uses, whichever is more. Missing arguments are 0.
+		self.arity = {name: 0 for name in self.numbers}
+		for _, name, _, body in functions:
+			for c in body:
+				if c.type == CommandType.CALL and c.arg1 in self.arity:
+					self.arity[c.arg1] = max(self.arity[c.arg1], c.arg2)
+				elif c.type in [CommandType.PUSH, CommandType.POP] and c.arg1 == 'argument':
+					self.arity[name] = max(self.arity[name], c.arg2 + 1)
+
+		self.source = '\n'.join(
+			FunctionWriter(self, filename, name, i, num_locals, body).source()
+			for i, (filename, name, num_locals, body) in enumerate(functions)
+		)
+		self.namespace = {'ram': self.ram, 'Halt': Halt, 'VMError': VMError}
+		exec(compile(self.source, '<vm program>', 'exec'), self.namespace)
+		self.halted = False
+
+	def static(self, filename, index):
+		"""
+		Returns the RAM address of a static variable. Statics are given
+		addresses from STATIC_BASE in the order they first appear in the
+		program, as the assembler gives addresses to variables.
+		"""
+		if (filename, index) not in self.statics:
+			self.statics[filename, index] = STATIC_BASE + len(self.statics)
+		return self.statics[filename, index]
+
+	def parameters(self, name):
+		"""
+		Returns the source of the parameters of a function after this and
+		that.
+		"""
+		return ''.join(f', a{i}=0' for i in range(self.arity[name]))
+
+	def call(self, name, args):
+		"""
+		Returns the source of a call of a function, given the source of its
+		arguments.
+		"""
+		if name not in self.numbers:
+			raise VMError(f"function {name} is not defined.")
+		return f'f{self.numbers[name]}({", ".join(["this", "that"] + args)})'
+
+	def run(self, function='Sys.init', args=()):
+		"""
+		Calls a function of the program with a list of arguments, in a thread
+		with a stack large enough for RECURSION_LIMIT nested calls. Returns
+		the value it returns, or None if the program halts. Raises VMError if
+		the program addresses RAM out of range, nests calls too deeply, or
+		runs past the end of a function.
+		"""
+		if function not in self.numbers:
+			raise VMError(f"function {function} is not defined.")
+		f = self.namespace[f'f{self.numbers[function]}']
+		outcome = []
+
+		def target():
+			try:
+				outcome.append(f(0, 0, *args))
+			except Halt:
+				self.halted = True
+				outcome.append(None)
+			except RecursionError:
+				outcome.append(VMError(
+					f"calls are nested more than {RECURSION_LIMIT} deep."
+				))
+			except IndexError:
+				outcome.append(VMError("a RAM address is out of range."))
+			except VMError as error:
+				outcome.append(error)
+
+		limit = sys.getrecursionlimit()
+		size = threading.stack_size(STACK_SIZE)
+		sys.setrecursionlimit(RECURSION_LIMIT)
+		try:
+			thread = threading.Thread(target=target)
+			thread.start()
+			thread.join()
+		finally:
+			threading.stack_size(size)
+			sys.setrecursionlimit(limit)
+
+		result = outcome[0]
+		if isinstance(result, VMError):
+			raise result
+		return result
+
+def load(path):
+	"""
+	Returns a Program compiled from a .vm file, or the .vm files of a
+	directory.
+	"""
+	return Program([Parser(vm_file) for vm_file in Initialiser(path).vm_files])
+
+if __name__ == '__main__':
+	options = sys.argv[2:]
+	start = time.perf_counter()
+	try:
+		program = load(sys.argv[1])
+		compiled = time.perf_counter()
+		if '--source' in options:
+			with open(options[options.index('--source') + 1], 'w') as f:
+				f.write(program.source)
+		program.run()
+	except VMError as error:
+		sys.exit(f"VMError: {error}")
+	finished = time.perf_counter()
+	print(f'compiled in {compiled - start:.3f}s, ran in {finished - compiled:.3f}s'
+		+ (', halted' if program.halted else ''))
+	if '--ram' in options:
+		first = int(options[options.index('--ram') + 1])
+		last = int(options[options.index('--ram') + 2])
+		for address in range(first, last + 1):
+			value = program.ram[address]
+			print(f'RAM[{address}] = {value - 0x10000 if value & 0x8000 else value}')